@@ -0,0 +1,150 @@
+# Evaluate many positions at once with NumPy, for scoring position dumps offline
+#
+# Positions are packed into an (N, 64) int8 array of piece codes, 0 for an
+# empty square and 1 to 12 for the pieces in PIECES order. Material and the
+# piece-square tables are table lookups over that array, and the pawn
+# structure terms of pawns.py are the same bit tricks done on an (N,) array of
+# uint64 pawn bitboards, so the scores match evaluate_position exactly
+# without a Python loop over the positions.
+#
+#   scores = evaluate_batch([read_fen_position(name) for name in names])
+#
+# NumPy is only needed here and by nnue.py, which shares require_numpy; the game and the search don't use it.
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from evaluation import MIDDLEGAME_SCORES, ENDGAME_SCORES, PHASE_VALUES, MAX_PHASE
+from pawns import DOUBLED, ISOLATED, BACKWARD, PASSED, FULL, FILES
+
+PIECES = 'PNBRQKpnbrqk'
+
+def require_numpy(feature='batch evaluation'):
+    if np is None:
+        raise ImportError(f"{feature} needs NumPy (pip install numpy)")
+
+def build_tables():
+    # Lookup tables indexed by [piece code, square], with row 0 for empty squares
+    middlegame = np.zeros((13, 64), dtype=np.int32)
+    endgame = np.zeros((13, 64), dtype=np.int32)
+    phase = np.zeros(13, dtype=np.int32)
+    for index, piece in enumerate(PIECES):
+        middlegame[index + 1] = MIDDLEGAME_SCORES[piece]
+        endgame[index + 1] = ENDGAME_SCORES[piece]
+        phase[index + 1] = PHASE_VALUES[piece]
+    # Piece character byte to piece code, anything else (None is packed as '.') is empty
+    codes = np.zeros(256, dtype=np.int8)
+    for index, piece in enumerate(PIECES):
+        codes[ord(piece)] = index + 1
+    return middlegame, endgame, phase, codes
+
+if np is not None:
+    MIDDLEGAME_TABLE, ENDGAME_TABLE, PHASE_TABLE, PIECE_CODES = build_tables()
+    BYTE_COUNTS = np.array([bin(byte).count('1') for byte in range(256)], dtype=np.int32)
+    # Shift amounts and masks as uint64 scalars, so the bitboard arithmetic stays unsigned
+    U1, U7, U8, U9, U16, U32 = (np.uint64(bits) for bits in (1, 7, 8, 9, 16, 32))
+    NOT_FILE_A = np.uint64(FULL ^ FILES[0])
+    NOT_FILE_H = np.uint64(FULL ^ FILES[7])
+    RANK_8 = np.uint64(0xFF)
+    ROW_MASKS = tuple(np.uint64(0xFF << (row * 8)) for row in range(8))
+
+# Passed pawn bonuses by row of the board, row 0 being the eighth rank
+WHITE_PASSED = tuple(PASSED[7 - row] for row in range(8))
+BLACK_PASSED = tuple(PASSED[row] for row in range(8))
+
+def pack_positions(positions):
+    # positions are the tuples read_fen_position returns. Gives (pieces, white_to_move):
+    # the (N, 64) int8 piece codes and an (N,) bool array.
+    require_numpy()
+    # All the squares of all the positions as one string, so the whole batch is decoded in one go.
+    # Turning the lists into characters is the only per-square Python work left.
+    text = ''.join([piece or '.' for position in positions for piece in position[0]])
+    pieces = PIECE_CODES[np.frombuffer(text.encode('ascii'), dtype=np.uint8)].reshape(-1, 64)
+    white_to_move = np.array([position[1] == 'w' for position in positions], dtype=bool)
+    return pieces, white_to_move
+
+def popcount(bbs):
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(bbs).astype(np.int32)
+    # NumPy before 2.0: count the bits a byte at a time
+    return BYTE_COUNTS[bbs.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+def pack_bitboards(boards):
+    # (N, 64) bool to one uint64 bitboard per row, bit n being square n as in bitboard.py
+    return np.packbits(boards, axis=1, bitorder='little').view('<u8').reshape(-1)
+
+def fill_north(bbs):
+    # Each bit smeared towards the eighth rank, which is towards bit 0
+    bbs = bbs | (bbs >> U8)
+    bbs |= bbs >> U16
+    return bbs | (bbs >> U32)
+
+def fill_south(bbs):
+    bbs = bbs | (bbs << U8)
+    bbs |= bbs << U16
+    return bbs | (bbs << U32)
+
+def sideways(bbs):
+    # The squares either side of each bit
+    return ((bbs & NOT_FILE_A) >> U1) | ((bbs & NOT_FILE_H) << U1)
+
+def side_structure(pawns, enemy_pawns, colour):
+    # (middlegame, endgame) int32 arrays for one side's pawn bitboards, following
+    # side_structure in pawns.py with every step done on all N bitboards at once
+    files = fill_south(fill_north(pawns))
+    file_count = popcount(files & RANK_8)
+    doubled = popcount(pawns) - file_count
+    isolated_pawns = pawns & ~sideways(files)
+    isolated = popcount(isolated_pawns)
+
+    if colour == 0:
+        # White moves towards bit 0, so the squares an enemy pawn blocks or guards lie south of it
+        blocked = fill_south(enemy_pawns << U8)
+        supported = sideways(fill_north(pawns))
+        enemy_attacks = ((enemy_pawns & NOT_FILE_A) << U7) | ((enemy_pawns & NOT_FILE_H) << U9)
+        stop_attacked = enemy_attacks << U8
+        bonuses = WHITE_PASSED
+    else:
+        blocked = fill_north(enemy_pawns >> U8)
+        supported = sideways(fill_south(pawns))
+        enemy_attacks = ((enemy_pawns & NOT_FILE_A) >> U9) | ((enemy_pawns & NOT_FILE_H) >> U7)
+        stop_attacked = enemy_attacks >> U8
+        bonuses = BLACK_PASSED
+    blocked |= sideways(blocked)
+    backward = popcount(pawns & ~isolated_pawns & ~supported & stop_attacked)
+
+    passed = pawns & ~blocked
+    middlegame = DOUBLED[0] * doubled + ISOLATED[0] * isolated + BACKWARD[0] * backward
+    endgame = DOUBLED[1] * doubled + ISOLATED[1] * isolated + BACKWARD[1] * backward
+    for row in range(1, 7):
+        count = popcount(passed & ROW_MASKS[row])
+        middlegame += bonuses[row][0] * count
+        endgame += bonuses[row][1] * count
+    return middlegame, endgame
+
+def evaluate_packed(pieces, white_to_move):
+    # Scores of packed positions from each side to move's point of view, as an (N,) int32 array
+    require_numpy()
+    pieces = pieces.astype(np.intp)
+    squares = np.arange(64)
+    middlegame = MIDDLEGAME_TABLE[pieces, squares].sum(axis=1)
+    endgame = ENDGAME_TABLE[pieces, squares].sum(axis=1)
+    phase = np.minimum(PHASE_TABLE[pieces].sum(axis=1), MAX_PHASE)
+
+    white_pawns = pack_bitboards(pieces == 1)
+    black_pawns = pack_bitboards(pieces == 7)
+    white_middlegame, white_endgame = side_structure(white_pawns, black_pawns, 0)
+    black_middlegame, black_endgame = side_structure(black_pawns, white_pawns, 1)
+    middlegame += white_middlegame - black_middlegame
+    endgame += white_endgame - black_endgame
+
+    # Same blend and rounding as taper() in evaluation.py
+    scores = (middlegame * phase + endgame * (MAX_PHASE - phase)) // MAX_PHASE
+    return np.where(white_to_move, scores, -scores).astype(np.int32)
+
+def evaluate_batch(positions):
+    # Scores of the tuples read_fen_position returns, from each side to move's point of view
+    pieces, white_to_move = pack_positions(positions)
+    return evaluate_packed(pieces, white_to_move)
@@ -0,0 +1,701 @@
+# Bitboard representation of a chess position
+#
+# Squares use the same numbering as the position list in chess.py: 0 is a8,
+# 7 is h8, 56 is a1 and 63 is h1. Bit n of a bitboard is set when square n is
+# in the set, so "one rank towards rank 8" is a shift right by 8.
+#
+# This module does not import pygame, so it can be used without a display.
+
+from magic import rook_attacks, bishop_attacks
+from zobrist import PIECE_KEYS, BLACK_TO_MOVE_KEY, CASTLING_KEYS, EN_PASSANT_KEYS
+from evaluation import MIDDLEGAME_SCORES, ENDGAME_SCORES, PHASE_VALUES
+
+WHITE = 0
+BLACK = 1
+
+PAWN = 0
+KNIGHT = 1
+BISHOP = 2
+ROOK = 3
+QUEEN = 4
+KING = 5
+
+# Piece characters in bitboard order: white pieces are 0-5, black pieces are 6-11
+PIECES = 'PNBRQKpnbrqk'
+PIECE_INDEX = {piece: index for index, piece in enumerate(PIECES)}
+
+# Castling rights as bit flags
+WHITE_KINGSIDE = 1
+WHITE_QUEENSIDE = 2
+BLACK_KINGSIDE = 4
+BLACK_QUEENSIDE = 8
+CASTLING_FLAGS = {'K': WHITE_KINGSIDE, 'Q': WHITE_QUEENSIDE, 'k': BLACK_KINGSIDE, 'q': BLACK_QUEENSIDE}
+
+FULL = (1 << 64) - 1
+FILE_A = sum(1 << (rank * 8) for rank in range(8))
+FILE_H = FILE_A << 7
+NOT_FILE_A = FULL ^ FILE_A
+NOT_FILE_H = FULL ^ FILE_H
+RANK_8 = 0xFF
+RANK_1 = RANK_8 << 56
+RANK_6 = RANK_8 << 16
+RANK_3 = RANK_8 << 40
+
+def square_name(square):
+    return 'abcdefgh'[square % 8] + str(8 - square // 8)
+
+def square_index(name):
+    return (8 - int(name[1])) * 8 + 'abcdefgh'.index(name[0])
+
+def iterate_bits(bb):
+    # Yield the square of every set bit, lowest first
+    while bb:
+        lsb = bb & -bb
+        yield lsb.bit_length() - 1
+        bb ^= lsb
+
+# Moves are packed into an int: from square, to square, then the promotion piece type
+def encode_move(from_square, to_square, promotion=0):
+    return from_square | (to_square << 6) | (promotion << 12)
+
+def move_from(move):
+    return move & 63
+
+def move_to(move):
+    return (move >> 6) & 63
+
+def move_promotion(move):
+    return move >> 12
+
+def move_name(move):
+    # Long algebraic notation as used by UCI, e.g. e2e4 or a7a8q
+    name = square_name(move_from(move)) + square_name(move_to(move))
+    if move_promotion(move):
+        name += 'pnbrqk'[move_promotion(move)]
+    return name
+
+# Whole-board shifts, masking off squares that wrapped around the board edge
+def shift_north(bb):
+    return bb >> 8
+
+def shift_south(bb):
+    return (bb << 8) & FULL
+
+def shift_east(bb):
+    return (bb << 1) & NOT_FILE_A
+
+def shift_west(bb):
+    return (bb >> 1) & NOT_FILE_H
+
+def shift_north_east(bb):
+    return (bb >> 7) & NOT_FILE_A
+
+def shift_north_west(bb):
+    return (bb >> 9) & NOT_FILE_H
+
+def shift_south_east(bb):
+    return (bb << 9) & NOT_FILE_A & FULL
+
+def shift_south_west(bb):
+    return (bb << 7) & NOT_FILE_H & FULL
+
+ROOK_SHIFTS = (shift_north, shift_south, shift_east, shift_west)
+BISHOP_SHIFTS = (shift_north_east, shift_north_west, shift_south_east, shift_south_west)
+
+def pawn_attacks_set(pawns, colour):
+    if colour == WHITE:
+        return shift_north_east(pawns) | shift_north_west(pawns)
+    return shift_south_east(pawns) | shift_south_west(pawns)
+
+def knight_attacks_set(knights):
+    east = shift_east(knights)
+    west = shift_west(knights)
+    attacks = ((east | west) << 16) & FULL | (east | west) >> 16
+    east = shift_east(east)
+    west = shift_west(west)
+    attacks |= ((east | west) << 8) & FULL | (east | west) >> 8
+    return attacks
+
+def king_attacks_set(kings):
+    attacks = shift_east(kings) | shift_west(kings)
+    row = kings | attacks
+    return attacks | shift_north(row) | shift_south(row)
+
+def slider_attacks_set(sliders, empty, shifts):
+    # Flood every slider outwards at once, stopping each ray at the first blocker
+    attacks = 0
+    for shift in shifts:
+        ray = shift(sliders)
+        while ray:
+            attacks |= ray
+            ray = shift(ray & empty)
+    return attacks
+
+# Per-square attack tables
+def build_table(attack_set):
+    return tuple(attack_set(1 << square) for square in range(64))
+
+KNIGHT_ATTACKS = build_table(knight_attacks_set)
+KING_ATTACKS = build_table(king_attacks_set)
+PAWN_ATTACKS = (
+    build_table(lambda bb: pawn_attacks_set(bb, WHITE)),
+    build_table(lambda bb: pawn_attacks_set(bb, BLACK))
+)
+
+def queen_attacks(square, occupied):
+    return rook_attacks(square, occupied) | bishop_attacks(square, occupied)
+
+def build_between():
+    # BETWEEN[a][b] holds the squares strictly between a and b when they share a line
+    between = []
+    for a in range(64):
+        row = []
+        for b in range(64):
+            squares = 0
+            if rook_attacks(a, 0) >> b & 1:
+                squares = rook_attacks(a, 1 << b) & rook_attacks(b, 1 << a)
+            elif bishop_attacks(a, 0) >> b & 1:
+                squares = bishop_attacks(a, 1 << b) & bishop_attacks(b, 1 << a)
+            row.append(squares)
+        between.append(tuple(row))
+    return tuple(between)
+
+BETWEEN = build_between()
+
+# Squares that must be empty for each castling move, and the king's destination
+CASTLING_MOVES = (
+    (WHITE_KINGSIDE, 60, 62, (1 << 61) | (1 << 62)),
+    (WHITE_QUEENSIDE, 60, 58, (1 << 57) | (1 << 58) | (1 << 59)),
+    (BLACK_KINGSIDE, 4, 6, (1 << 5) | (1 << 6)),
+    (BLACK_QUEENSIDE, 4, 2, (1 << 1) | (1 << 2) | (1 << 3))
+)
+
+# Castling rights that survive a move touching each square (king or rook moved or captured)
+CASTLING_KEEP = [15] * 64
+CASTLING_KEEP[60] ^= WHITE_KINGSIDE | WHITE_QUEENSIDE
+CASTLING_KEEP[63] ^= WHITE_KINGSIDE
+CASTLING_KEEP[56] ^= WHITE_QUEENSIDE
+CASTLING_KEEP[4] ^= BLACK_KINGSIDE | BLACK_QUEENSIDE
+CASTLING_KEEP[7] ^= BLACK_KINGSIDE
+CASTLING_KEEP[0] ^= BLACK_QUEENSIDE
+CASTLING_KEEP = tuple(CASTLING_KEEP)
+
+# Rook from and to squares, keyed by the castling king's destination
+CASTLING_ROOKS = {62: (63, 61), 58: (56, 59), 6: (7, 5), 2: (0, 3)}
+
+class Board:
+    def __init__(self):
+        # One bitboard per piece, indexed like PIECES
+        self.pieces = [0] * 12
+        # Occupancy per colour, plus both together
+        self.occupancy = [0, 0]
+        self.occupied = 0
+        # The same 64-entry list form that read_fen_position returns
+        self.squares = [None] * 64
+        self.colour = WHITE
+        self.castling = 0
+        self.en_passant = -1
+        self.halfmove = 0
+        self.fullmove = 1
+        # Zobrist key, kept up to date by every change to the board
+        self.hash = 0
+        # Evaluation totals from white's point of view, kept up to date the same way (see evaluation.py)
+        self.middlegame = 0
+        self.endgame = 0
+        self.phase = 0
+        # Zobrist key of the pawns alone, for the pawn hash table in pawns.py
+        self.pawn_hash = 0
+        # Neural network accumulator, when one is attached (see nnue.py)
+        self.accumulator = None
+        # One (move, captured piece, castling, en passant, halfmove, hash) tuple per move made
+        self.undo_stack = []
+
+    @classmethod
+    def from_position(cls, position, active_colour='w', castling='-', en_passant='-', halfmove=0, fullmove=1):
+        # Build a board from the tuple read_fen_position returns
+        board = cls()
+        for square, piece in enumerate(position):
+            if piece is not None:
+                board.put_piece(square, piece)
+        board.colour = WHITE if active_colour == 'w' else BLACK
+        for char in castling:
+            board.castling |= CASTLING_FLAGS.get(char, 0)
+        board.en_passant = -1 if en_passant == '-' else square_index(en_passant)
+        board.halfmove = int(halfmove)
+        board.fullmove = int(fullmove)
+        board.hash ^= board.state_hash()
+        return board
+
+    @classmethod
+    def from_fen(cls, fen):
+        params = fen.split()
+        position = []
+        for char in params[0]:
+            if char.isdigit():
+                position.extend([None] * int(char))
+            elif char != '/':
+                position.append(char)
+        return cls.from_position(position, *params[1:6])
+
+    def to_position(self):
+        # Convert back to the tuple read_fen_position returns, so the pygame UI can use it
+        return list(self.squares), self.active_colour, self.castling_string, self.en_passant_string, str(self.halfmove), str(self.fullmove)
+
+    def fen(self):
+        ranks = []
+        for rank in range(8):
+            text = ''
+            empty = 0
+            for piece in self.squares[rank * 8:rank * 8 + 8]:
+                if piece is None:
+                    empty += 1
+                else:
+                    if empty:
+                        text += str(empty)
+                        empty = 0
+                    text += piece
+            if empty:
+                text += str(empty)
+            ranks.append(text)
+        return ' '.join(('/'.join(ranks), self.active_colour, self.castling_string, self.en_passant_string, str(self.halfmove), str(self.fullmove)))
+
+    def history(self):
+        # The FEN of the position before the first move made, and the moves since, so the
+        # same game can be rebuilt elsewhere with its repetition history intact
+        moves = [entry[0] for entry in self.undo_stack]
+        for move in moves:
+            self.unmake_move()
+        fen = self.fen()
+        for move in moves:
+            self.make_move(move)
+        return fen, moves
+
+    @property
+    def active_colour(self):
+        return 'w' if self.colour == WHITE else 'b'
+
+    @property
+    def castling_string(self):
+        text = ''.join(char for char, flag in CASTLING_FLAGS.items() if self.castling & flag)
+        return text or '-'
+
+    @property
+    def en_passant_string(self):
+        return '-' if self.en_passant < 0 else square_name(self.en_passant)
+
+    def state_hash(self):
+        # The part of the Zobrist key that isn't piece placement
+        key = CASTLING_KEYS[self.castling]
+        if self.colour == BLACK:
+            key ^= BLACK_TO_MOVE_KEY
+        if self.en_passant >= 0:
+            key ^= EN_PASSANT_KEYS[self.en_passant % 8]
+        return key
+
+    def put_piece(self, square, piece):
+        bit = 1 << square
+        index = PIECE_INDEX[piece]
+        self.pieces[index] |= bit
+        self.occupancy[index // 6] |= bit
+        self.occupied |= bit
+        self.squares[square] = piece
+        self.hash ^= PIECE_KEYS[piece][square]
+        self.middlegame += MIDDLEGAME_SCORES[piece][square]
+        self.endgame += ENDGAME_SCORES[piece][square]
+        self.phase += PHASE_VALUES[piece]
+        if index == 0 or index == 6:
+            self.pawn_hash ^= PIECE_KEYS[piece][square]
+        if self.accumulator is not None:
+            self.accumulator.add(index, square)
+
+    def remove_piece(self, square):
+        piece = self.squares[square]
+        bit = 1 << square
+        index = PIECE_INDEX[piece]
+        self.pieces[index] ^= bit
+        self.occupancy[index // 6] ^= bit
+        self.occupied ^= bit
+        self.squares[square] = None
+        self.hash ^= PIECE_KEYS[piece][square]
+        self.middlegame -= MIDDLEGAME_SCORES[piece][square]
+        self.endgame -= ENDGAME_SCORES[piece][square]
+        self.phase -= PHASE_VALUES[piece]
+        if index == 0 or index == 6:
+            self.pawn_hash ^= PIECE_KEYS[piece][square]
+        if self.accumulator is not None:
+            self.accumulator.remove(index, square)
+        return piece
+
+    def move_piece(self, from_square, to_square):
+        piece = self.squares[from_square]
+        bits = (1 << from_square) | (1 << to_square)
+        index = PIECE_INDEX[piece]
+        self.pieces[index] ^= bits
+        self.occupancy[index // 6] ^= bits
+        self.occupied ^= bits
+        self.squares[from_square] = None
+        self.squares[to_square] = piece
+        keys = PIECE_KEYS[piece]
+        self.hash ^= keys[from_square] ^ keys[to_square]
+        # Only the square changes, so just the difference between the two table entries
+        scores = MIDDLEGAME_SCORES[piece]
+        self.middlegame += scores[to_square] - scores[from_square]
+        scores = ENDGAME_SCORES[piece]
+        self.endgame += scores[to_square] - scores[from_square]
+        if index == 0 or index == 6:
+            self.pawn_hash ^= keys[from_square] ^ keys[to_square]
+        if self.accumulator is not None:
+            self.accumulator.move(index, from_square, to_square)
+
+    def make_move(self, move):
+        # Apply a move in place, remembering just enough to take it back
+        from_square = move & 63
+        to_square = (move >> 6) & 63
+        promotion = move >> 12
+        squares = self.squares
+        piece = squares[from_square]
+        captured = squares[to_square]
+        self.undo_stack.append((move, captured, self.castling, self.en_passant, self.halfmove, self.hash))
+        # Take the old side to move, castling rights and en passant file out of the key
+        self.hash ^= self.state_hash()
+
+        if captured is not None:
+            self.remove_piece(to_square)
+        self.move_piece(from_square, to_square)
+        self.halfmove += 1
+        en_passant = -1
+
+        if piece == 'P' or piece == 'p':
+            self.halfmove = 0
+            if to_square == self.en_passant:
+                # The captured pawn sits behind the en passant square
+                self.remove_piece(to_square + 8 if piece == 'P' else to_square - 8)
+            elif to_square - from_square == 16 or from_square - to_square == 16:
+                en_passant = (from_square + to_square) // 2
+            elif promotion:
+                self.remove_piece(to_square)
+                self.put_piece(to_square, PIECES[self.colour * 6 + promotion])
+        elif (piece == 'K' or piece == 'k') and (to_square - from_square == 2 or from_square - to_square == 2):
+            rook_from, rook_to = CASTLING_ROOKS[to_square]
+            self.move_piece(rook_from, rook_to)
+
+        if captured is not None:
+            self.halfmove = 0
+        self.castling &= CASTLING_KEEP[from_square] & CASTLING_KEEP[to_square]
+        self.en_passant = en_passant
+        if self.colour == BLACK:
+            self.fullmove += 1
+        self.colour ^= 1
+        self.hash ^= self.state_hash()
+
+    def unmake_move(self):
+        # Take back the last move made, restoring the position exactly
+        move, captured, castling, en_passant, halfmove, key = self.undo_stack.pop()
+        from_square = move & 63
+        to_square = (move >> 6) & 63
+        self.colour ^= 1
+        if self.colour == BLACK:
+            self.fullmove -= 1
+
+        if move >> 12:
+            self.remove_piece(to_square)
+            self.put_piece(from_square, 'P' if self.colour == WHITE else 'p')
+        else:
+            self.move_piece(to_square, from_square)
+        piece = self.squares[from_square]
+
+        if captured is not None:
+            self.put_piece(to_square, captured)
+        elif to_square == en_passant and (piece == 'P' or piece == 'p'):
+            if piece == 'P':
+                self.put_piece(to_square + 8, 'p')
+            else:
+                self.put_piece(to_square - 8, 'P')
+        elif (piece == 'K' or piece == 'k') and (to_square - from_square == 2 or from_square - to_square == 2):
+            rook_from, rook_to = CASTLING_ROOKS[to_square]
+            self.move_piece(rook_to, rook_from)
+
+        self.castling = castling
+        self.en_passant = en_passant
+        self.halfmove = halfmove
+        self.hash = key
+
+    def king_square(self, colour):
+        return self.pieces[colour * 6 + KING].bit_length() - 1
+
+    def attackers_to(self, square, colour, occupied=None):
+        # All pieces of the given colour that attack square
+        if occupied is None:
+            occupied = self.occupied
+        pieces = self.pieces
+        base = colour * 6
+        rooks = pieces[base + ROOK] | pieces[base + QUEEN]
+        bishops = pieces[base + BISHOP] | pieces[base + QUEEN]
+        return ((PAWN_ATTACKS[colour ^ 1][square] & pieces[base + PAWN])
+                | (KNIGHT_ATTACKS[square] & pieces[base + KNIGHT])
+                | (KING_ATTACKS[square] & pieces[base + KING])
+                | (rook_attacks(square, occupied) & rooks)
+                | (bishop_attacks(square, occupied) & bishops))
+
+    def is_attacked(self, square, colour):
+        return self.attackers_to(square, colour) != 0
+
+    def in_check(self, colour=None):
+        if colour is None:
+            colour = self.colour
+        return self.is_attacked(self.king_square(colour), colour ^ 1)
+
+    def attacked_squares(self, colour, occupied=None):
+        # Every square attacked by the given colour, computed for all pieces at once
+        if occupied is None:
+            occupied = self.occupied
+        pieces = self.pieces
+        base = colour * 6
+        empty = FULL ^ occupied
+        return (pawn_attacks_set(pieces[base + PAWN], colour)
+                | knight_attacks_set(pieces[base + KNIGHT])
+                | king_attacks_set(pieces[base + KING])
+                | slider_attacks_set(pieces[base + ROOK] | pieces[base + QUEEN], empty, ROOK_SHIFTS)
+                | slider_attacks_set(pieces[base + BISHOP] | pieces[base + QUEEN], empty, BISHOP_SHIFTS))
+
+    def piece_targets(self, square):
+        # Bitboard of the squares the piece on square can move to, ignoring checks
+        piece = self.squares[square]
+        index = PIECE_INDEX[piece]
+        colour = index // 6
+        kind = index % 6
+        own = self.occupancy[colour]
+        occupied = self.occupied
+        if kind == PAWN:
+            targets = PAWN_ATTACKS[colour][square] & self.occupancy[colour ^ 1]
+            if self.en_passant >= 0:
+                targets |= PAWN_ATTACKS[colour][square] & (1 << self.en_passant)
+            if colour == WHITE:
+                single = (1 << square) >> 8 & ~occupied
+                targets |= single | (single & RANK_3) >> 8 & ~occupied
+            else:
+                single = (1 << square) << 8 & ~occupied & FULL
+                targets |= single | (single & RANK_6) << 8 & ~occupied & FULL
+            return targets
+        if kind == KNIGHT:
+            return KNIGHT_ATTACKS[square] & ~own
+        if kind == BISHOP:
+            return bishop_attacks(square, occupied) & ~own
+        if kind == ROOK:
+            return rook_attacks(square, occupied) & ~own
+        if kind == QUEEN:
+            return queen_attacks(square, occupied) & ~own
+        targets = KING_ATTACKS[square] & ~own
+        for flag, king_from, king_to, between in CASTLING_MOVES:
+            if self.castling & flag and king_from == square and not occupied & between:
+                targets |= 1 << king_to
+        return targets
+
+    def piece_moves(self, square):
+        # The same list of target squares check_valid_moves returns for the piece on square
+        return list(iterate_bits(self.piece_targets(square)))
+
+    def generate_moves(self):
+        # Pseudo-legal moves for the side to move, as packed move ints
+        moves = []
+        promotion_rank = RANK_8 if self.colour == WHITE else RANK_1
+        pawns = self.pieces[self.colour * 6 + PAWN]
+        for from_square in iterate_bits(self.occupancy[self.colour]):
+            targets = self.piece_targets(from_square)
+            if pawns >> from_square & 1 and targets & promotion_rank:
+                for to_square in iterate_bits(targets):
+                    for promotion in (QUEEN, ROOK, BISHOP, KNIGHT):
+                        moves.append(encode_move(from_square, to_square, promotion))
+            else:
+                for to_square in iterate_bits(targets):
+                    moves.append(from_square | (to_square << 6))
+        return moves
+
+    def pinned_pieces(self, colour=None):
+        # Map each pinned piece of colour to the line it may still move along
+        if colour is None:
+            colour = self.colour
+        them = colour ^ 1
+        king = self.king_square(colour)
+        pieces = self.pieces
+        enemy = self.occupancy[them]
+        rooks = pieces[them * 6 + ROOK] | pieces[them * 6 + QUEEN]
+        bishops = pieces[them * 6 + BISHOP] | pieces[them * 6 + QUEEN]
+        # Enemy sliders that would hit the king if our own pieces were not there
+        snipers = (rook_attacks(king, enemy) & rooks) | (bishop_attacks(king, enemy) & bishops)
+        pins = {}
+        for sniper in iterate_bits(snipers):
+            blockers = BETWEEN[king][sniper] & self.occupied
+            if blockers and not blockers & (blockers - 1) and blockers & self.occupancy[colour]:
+                pins[blockers.bit_length() - 1] = BETWEEN[king][sniper] | (1 << sniper)
+        return pins
+
+    def king_danger(self):
+        # Squares the king to move may not step onto, as in legal_context
+        king = self.king_square(self.colour)
+        return self.attacked_squares(self.colour ^ 1, self.occupied ^ (1 << king))
+
+    def legal_context(self, danger=True):
+        # Everything legal move generation needs to know about checks and pins:
+        # squares the king may not step onto, the checking pieces, the squares
+        # other pieces must move to while in check, and the pinned pieces' lines.
+        # Worked out once per position and shared by every stage of generation.
+        # With danger=False the king's squares are left as None, to be worked out
+        # only if a king move turns up; checkers and pins are enough for the rest.
+        us = self.colour
+        them = us ^ 1
+        king = self.king_square(us)
+        if danger:
+            # Lift the king off the board so it can't step back along a checking line
+            danger = self.attacked_squares(them, self.occupied ^ (1 << king))
+        else:
+            danger = None
+        checkers = self.attackers_to(king, them)
+        if checkers & (checkers - 1):
+            # Double check, only the king can move
+            check_mask = 0
+        elif checkers:
+            # Single check, other pieces must capture the checker or block the line
+            check_mask = checkers | BETWEEN[king][checkers.bit_length() - 1]
+        else:
+            check_mask = FULL
+        return danger, checkers, check_mask, self.pinned_pieces(us)
+
+    def legal_moves(self, captures=True, quiets=True, context=None):
+        # Fully legal moves for the side to move, as packed move ints.
+        # Checkers and pins are worked out once, then every piece's targets are
+        # masked with them, so no move has to be made to see if it leaves the
+        # king in check. captures also covers promotions, quiets covers castling.
+        if context is None:
+            context = self.legal_context()
+        danger, checkers, check_mask, pins = context
+        if danger is None:
+            danger = self.king_danger()
+        us = self.colour
+        them = us ^ 1
+        base = us * 6
+        pieces = self.pieces
+        occupied = self.occupied
+        empty = FULL ^ occupied
+        enemy = self.occupancy[them]
+        king = self.king_square(us)
+        moves = []
+        append = moves.append
+
+        targets = 0
+        if captures:
+            targets |= enemy
+        if quiets:
+            targets |= empty
+
+        for to_square in iterate_bits(KING_ATTACKS[king] & targets & ~danger):
+            append(king | (to_square << 6))
+
+        if not check_mask:
+            return moves
+        if quiets and not checkers:
+            for flag, king_from, king_to, between in CASTLING_MOVES:
+                if self.castling & flag and king_from == king and not occupied & between:
+                    if not danger & ((1 << king_to) | (1 << ((king_from + king_to) // 2))):
+                        append(king | (king_to << 6))
+
+        mask = targets & check_mask
+
+        for from_square in iterate_bits(pieces[base + KNIGHT]):
+            if from_square not in pins:
+                for to_square in iterate_bits(KNIGHT_ATTACKS[from_square] & mask):
+                    append(from_square | (to_square << 6))
+
+        for from_square in iterate_bits(pieces[base + BISHOP] | pieces[base + QUEEN]):
+            attacks = bishop_attacks(from_square, occupied) & mask
+            if from_square in pins:
+                attacks &= pins[from_square]
+            for to_square in iterate_bits(attacks):
+                append(from_square | (to_square << 6))
+
+        for from_square in iterate_bits(pieces[base + ROOK] | pieces[base + QUEEN]):
+            attacks = rook_attacks(from_square, occupied) & mask
+            if from_square in pins:
+                attacks &= pins[from_square]
+            for to_square in iterate_bits(attacks):
+                append(from_square | (to_square << 6))
+
+        # Pawns: promotions count as captures, other pushes as quiet moves
+        if us == WHITE:
+            promotion_rank = RANK_8
+            double_rank = RANK_3
+        else:
+            promotion_rank = RANK_1
+            double_rank = RANK_6
+        pawn_targets = 0
+        if captures:
+            pawn_targets |= enemy | (empty & promotion_rank)
+        if quiets:
+            pawn_targets |= empty & ~promotion_rank
+        pawn_mask = pawn_targets & check_mask
+        pawn_attacks = PAWN_ATTACKS[us]
+        for from_square in iterate_bits(pieces[base + PAWN]):
+            bit = 1 << from_square
+            if us == WHITE:
+                single = (bit >> 8) & empty
+                pushes = single | ((single & double_rank) >> 8) & empty
+            else:
+                single = (bit << 8) & empty
+                pushes = single | ((single & double_rank) << 8) & empty
+            attacks = ((pushes | (pawn_attacks[from_square] & enemy))) & pawn_mask
+            if from_square in pins:
+                attacks &= pins[from_square]
+            if attacks & promotion_rank:
+                for to_square in iterate_bits(attacks):
+                    for promotion in (QUEEN, ROOK, BISHOP, KNIGHT):
+                        append(from_square | (to_square << 6) | (promotion << 12))
+            else:
+                for to_square in iterate_bits(attacks):
+                    append(from_square | (to_square << 6))
+
+        if captures and self.en_passant >= 0:
+            # En passant removes two pawns from one line, so test it directly against the real occupancy
+            to_square = self.en_passant
+            captured_square = to_square + 8 if us == WHITE else to_square - 8
+            rooks = pieces[them * 6 + ROOK] | pieces[them * 6 + QUEEN]
+            bishops = pieces[them * 6 + BISHOP] | pieces[them * 6 + QUEEN]
+            for from_square in iterate_bits(PAWN_ATTACKS[them][to_square] & pieces[base + PAWN]):
+                after = occupied ^ (1 << from_square) ^ (1 << captured_square) | (1 << to_square)
+                if checkers and not checkers >> captured_square & 1 and not check_mask >> to_square & 1:
+                    continue
+                if rook_attacks(king, after) & rooks or bishop_attacks(king, after) & bishops:
+                    continue
+                append(from_square | (to_square << 6))
+
+        return moves
+
+    def is_legal(self, move, context=None):
+        # Whether a move, e.g. one read back from the transposition table, can be played here
+        from_square = move & 63
+        to_square = (move >> 6) & 63
+        promotion = move >> 12
+        piece = self.squares[from_square]
+        if piece is None or PIECE_INDEX[piece] // 6 != self.colour:
+            return False
+        if not self.piece_targets(from_square) >> to_square & 1:
+            return False
+        kind = PIECE_INDEX[piece] % 6
+        if kind == PAWN and (to_square < 8 or to_square >= 56):
+            if not KNIGHT <= promotion <= QUEEN:
+                return False
+        elif promotion:
+            return False
+        if context is None:
+            context = self.legal_context()
+        danger, checkers, check_mask, pins = context
+        if kind == KING:
+            if to_square - from_square == 2 or from_square - to_square == 2:
+                return move in self.legal_moves(False, True, context)
+            if danger is None:
+                danger = self.king_danger()
+            return not danger >> to_square & 1
+        if kind == PAWN and to_square == self.en_passant:
+            return move in self.legal_moves(True, False, context)
+        if not check_mask >> to_square & 1:
+            return False
+        return from_square not in pins or pins[from_square] >> to_square & 1 == 1
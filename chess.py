@@ -1,19 +1,23 @@
-import pygame
 import os
-import time
-
-# Initialize Pygame
-pygame.init()
+import sys
+from collections import OrderedDict
+from bitboard import Board, encode_move, move_from, move_to, move_name, QUEEN
+from core import read_fen_position
+from engine import Engine
+from search import MATE_SCORE, MATE_BOUND
+
+# pygame is only imported, and the window and font only made, by init_display when the game starts.
+# Importing this module then does nothing, which also matters for the engine process: started with
+# spawn, it imports the main module again, and that mustn't open a second window.
+pygame = None
+window = None
+font = None
 
 # Set the initial dimensions of the window
 window_width = 800
 window_height = 600
 window_size = (window_width, window_height)
 
-# Create the Pygame window
-window = pygame.display.set_mode(window_size, pygame.RESIZABLE)
-pygame.display.set_caption("Chess Game")
-
 # Set the colours
 BOARD_WHITE = (237, 214, 176)
 BOARD_BLACK = (184, 135, 98 )
@@ -21,12 +25,52 @@ BACKGROUND  = (48 , 46 , 43 )
 BLACK       = (0  , 0  , 0  )
 WHITE       = (255, 255, 255)
 GREY        = (128, 128, 128)
-
-# Set the font
-font = pygame.font.Font(None, 20)
-
-# Set the clock
-clock = pygame.time.Clock()
+HIGHLIGHT   = (219, 194, 70 )
+
+# How long the computer thinks about its move, in seconds
+COMPUTER_MOVETIME = 2.0
+# Milliseconds between checks for engine results while it is thinking, for 60 frames a second
+FRAME_TIME = 1000 // 60
+
+def init_display():
+    global pygame, window, font
+    import pygame
+
+    # Initialize Pygame
+    pygame.init()
+
+    # Create the Pygame window
+    window = pygame.display.set_mode(window_size, pygame.RESIZABLE)
+    pygame.display.set_caption("Chess Game")
+
+    # Set the font
+    font = pygame.font.Font(None, 20)
+
+class TextCache:
+    # Keeps rendered text surfaces so the same string is only rendered once
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.surfaces = OrderedDict()
+
+    def render(self, string, colour, text_font):
+        key = (string, colour, text_font)
+        surface = self.surfaces.get(key)
+        if surface is None:
+            surface = text_font.render(string, True, colour)
+            self.surfaces[key] = surface
+            # Drop the least recently used strings, e.g. old move counters
+            if len(self.surfaces) > self.max_entries:
+                self.surfaces.popitem(last=False)
+        else:
+            self.surfaces.move_to_end(key)
+        return surface
+
+text_cache = TextCache()
+
+def render_text(string, colour=WHITE, text_font=None):
+    if text_font is None:
+        text_font = font
+    return text_cache.render(string, colour, text_font)
 
 class Square:
     def __init__(self, x, y, colour, size, en_passant=False):
@@ -36,86 +80,111 @@ class Square:
         self.colour = colour
         self.en_passant = en_passant
 
-    def draw(self):
-        pygame.draw.rect(window, self.colour, (self.x, self.y, self.size + 1, self.size + 1))
-
-def read_fen_position(fen_filepath):
-    # Get the directory of the current script
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-
-    # Define the path to the other file
-    file_path = os.path.join(script_dir, 'Positions', fen_filepath)
-
-    # Open and read the file
-    with open(file_path, 'r') as file:
-        fen = file.read()
-
-    params = fen.split(' ')
-    fen = params[0]
-    active_colour = params[1]
-    castling = params[2]
-    en_passant = params[3]
-    halfmove = params[4]
-    fullmove = params[5]
-
-    ranks = fen.split('/')
-    position = []
-    for rank in ranks:
-        for char in rank:
-            if char.isdigit():
-                for i in range(int(char)):
-                    position.append(None)
-            else:
-                position.append(char)
-    return position, active_colour, castling, en_passant, halfmove, fullmove
-
-def draw_board(board_x, board_y, board_size):
-    # Draw the squares
+    def draw(self, surface=None):
+        if surface is None:
+            surface = window
+        pygame.draw.rect(surface, self.colour, (self.x, self.y, self.size + 1, self.size + 1))
+
+class Layer:
+    # A pre-rendered surface that is only redrawn when its key changes
+    def __init__(self, render):
+        self.render = render
+        self.key = None
+        self.surface = None
+
+    def is_current(self, key):
+        return self.surface is not None and self.key == key
+
+    def get(self, key, *args):
+        if not self.is_current(key):
+            self.surface = self.render(*args)
+            self.key = key
+        return self.surface
+
+def render_board_layer(board_x, board_y, board_size):
+    # Draw the 64 squares once onto their own surface
     square_size = board_size / 8
+    surface = pygame.Surface((int(board_size) + 2, int(board_size) + 2))
+    # Keep the sub-pixel offset so squares line up with pieces blitted at board_x, board_y
+    offset_x = board_x - int(board_x)
+    offset_y = board_y - int(board_y)
     for i in range(8):
         for j in range(8):
             if (i + j) % 2 == 0:
                 colour = BOARD_WHITE
             else:
                 colour = BOARD_BLACK
-            square = Square(board_x + j * square_size, board_y + i * square_size, colour, square_size)
-            square.draw()
+            square = Square(offset_x + j * square_size, offset_y + i * square_size, colour, square_size)
+            square.draw(surface)
+    return surface
+
+board_layer = Layer(render_board_layer)
+
+def draw_board(board_x, board_y, board_size, area=None):
+    # Draw the squares, or only the part of them inside area
+    surface = board_layer.get((board_x, board_y, board_size), board_x, board_y, board_size)
+    if area is None:
+        window.blit(surface, (int(board_x), int(board_y)))
+    else:
+        window.blit(surface, area, area.move(-int(board_x), -int(board_y)))
+
+# Map each piece character to its sprite file
+PIECE_SPRITES = {
+    'r': 'bR.png', 'n': 'bN.png', 'b': 'bB.png', 'q': 'bQ.png', 'k': 'bK.png', 'p': 'bp.png',
+    'R': 'wR.png', 'N': 'wN.png', 'B': 'wB.png', 'Q': 'wQ.png', 'K': 'wK.png', 'P': 'wp.png'
+}
+
+class SpriteAtlas:
+    def __init__(self, sprite_dir, max_sizes=4):
+        self.sprite_dir = sprite_dir
+        # Number of square sizes to keep scaled copies for before evicting the oldest
+        self.max_sizes = max_sizes
+        self.originals = {}
+        self.scaled = OrderedDict()
+
+    def load(self):
+        # Decode each of the 12 sprites from disk exactly once
+        for piece, filename in PIECE_SPRITES.items():
+            self.originals[piece] = pygame.image.load(os.path.join(self.sprite_dir, filename)).convert_alpha()
+
+    def rebuild(self, square_size):
+        # Scale every sprite to the given square size and remember the result
+        if not self.originals:
+            self.load()
+        size = int(square_size)
+        sprites = {}
+        for piece, image in self.originals.items():
+            sprites[piece] = pygame.transform.scale(image, (size, size))
+        self.scaled[size] = sprites
+        self.scaled.move_to_end(size)
+        while len(self.scaled) > self.max_sizes:
+            self.scaled.popitem(last=False)
+        return sprites
+
+    def sprites_for(self, square_size):
+        size = int(square_size)
+        sprites = self.scaled.get(size)
+        if sprites is None:
+            return self.rebuild(size)
+        self.scaled.move_to_end(size)
+        return sprites
+
+sprite_atlas = SpriteAtlas(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Piece_Sprites'))
 
 def draw_pieces(position, board_x, board_y, board_size):
-    # Get the directory of the current script
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-
-    # Define the path to the other file
-    file_path = os.path.join(script_dir, 'Piece_Sprites/')
-
-    piece_dict = {
-        'r': file_path + 'bR.png',
-        'n': file_path + 'bN.png',
-        'b': file_path + 'bB.png',
-        'q': file_path + 'bQ.png',
-        'k': file_path + 'bK.png',
-        'p': file_path + 'bP.png',
-        'R': file_path + 'wR.png',
-        'N': file_path + 'wN.png',
-        'B': file_path + 'wB.png',
-        'Q': file_path + 'wQ.png',
-        'K': file_path + 'wK.png',
-        'P': file_path + 'wP.png'
-    }
     # Draw the pieces
     square_size = board_size / 8
+    sprites = sprite_atlas.sprites_for(square_size)
     for i in range(8):
         for j in range(8):
             piece = position[i * 8 + j]
             if piece is not None:
-                piece_image = pygame.image.load(piece_dict[piece])
-                piece_image = pygame.transform.scale(piece_image, (int(square_size), int(square_size)))
-                window.blit(piece_image, (board_x + j * square_size, board_y + i * square_size))
+                window.blit(sprites[piece], (board_x + j * square_size, board_y + i * square_size))
             # else:
             #     text = font.render("None", True, WHITE)
             #     text_rect = text.get_rect(center=(board_x + j * square_size + square_size / 2, board_y + i * square_size + square_size / 2))
             #     window.blit(text, text_rect)
-            text = font.render(str(i * 8 + j), True, WHITE)
+            text = render_text(str(i * 8 + j), WHITE)
             text_rect = text.get_rect(center=(board_x + j * square_size + 7, board_y + i * square_size + 7))
             window.blit(text, text_rect)          
 
@@ -125,291 +194,185 @@ def recognise_clicked_piece(x, y, board_x, board_y, board_size):
     j = int((x - board_x) // square_size)
     return i * 8 + j
 
-
-
-# Read the FEN position
-position, active_colour, castling, en_passant, halfmove, fullmove = read_fen_position('En_Passant_fen.txt')
-
-# map the grid notation to the board index
-grid_to_index = {
-    'a8': 0, 'b8': 1, 'c8': 2, 'd8': 3, 'e8': 4, 'f8': 5, 'g8': 6, 'h8': 7,
-    'a7': 8, 'b7': 9, 'c7': 10, 'd7': 11, 'e7': 12, 'f7': 13, 'g7': 14, 'h7': 15,
-    'a6': 16, 'b6': 17, 'c6': 18, 'd6': 19, 'e6': 20, 'f6': 21, 'g6': 22, 'h6': 23,
-    'a5': 24, 'b5': 25, 'c5': 26, 'd5': 27, 'e5': 28, 'f5': 29, 'g5': 30, 'h5': 31,
-    'a4': 32, 'b4': 33, 'c4': 34, 'd4': 35, 'e4': 36, 'f4': 37, 'g4': 38, 'h4': 39,
-    'a3': 40, 'b3': 41, 'c3': 42, 'd3': 43, 'e3': 44, 'f3': 45, 'g3': 46, 'h3': 47,
-    'a2': 48, 'b2': 49, 'c2': 50, 'd2': 51, 'e2': 52, 'f2': 53, 'g2': 54, 'h2': 55,
-    'a1': 56, 'b1': 57, 'c1': 58, 'd1': 59, 'e1': 60, 'f1': 61, 'g1': 62, 'h1': 63
-}
-
-if en_passant == '-':
-    en_passant_index = -1
-else:
-    en_passant_index = grid_to_index[en_passant]
-
-def draw_game():
-    # Clear the screen
-    window.fill(BACKGROUND)
-
-    # Calculate the board size and position
+# The game being played, from the FEN file new_game reads
+board = None
+position = None
+
+# The latest engine result shown in the side panel as (depth, score, best line), and what the engine is doing
+engine_line = None
+engine_status = ''
+
+def new_game(fen_filepath='En_Passant_fen.txt'):
+    # Set up the board from a file in Positions/
+    global board, position
+    board = Board.from_position(*read_fen_position(fen_filepath))
+    # The board applies and takes back moves; position is its square list, so drawing sees every change
+    position = board.squares
+    sync_game_state()
+
+def sync_game_state():
+    # Copy the side to move, castling rights, en passant square and clocks back from the board
+    global active_colour, castling, en_passant, en_passant_index, halfmove, fullmove
+    active_colour = board.active_colour
+    castling = board.castling_string
+    en_passant = board.en_passant_string
+    en_passant_index = board.en_passant
+    halfmove = str(board.halfmove)
+    fullmove = str(board.fullmove)
+
+def board_geometry():
     board_size = min(window_width, window_height) * 0.8  # Board takes 80% of the smaller dimension
     board_x = 25 + window_width * 0.1
     board_y = (window_height / 2 - board_size / 2)
+    return board_x, board_y, board_size
 
-    # Draw the board and pieces
-    draw_board(board_x, board_y, board_size)
-    draw_pieces(position, board_x, board_y, board_size)
-
-    # Draw the rank and file labels
+def render_label_layer(board_x, board_y, board_size):
+    # Draw the rank and file labels onto a strip around the board
+    surface = pygame.Surface((int(board_size) + 40, int(board_size) + 40))
+    surface.fill(BACKGROUND)
     square_size = board_size / 8
+    left = board_x - 40
     for i in range(8):
-        text = font.render(str(8 - i), True, WHITE)
-        text_rect = text.get_rect(center=(board_x - 20, board_y + i * square_size + square_size / 2))
-        window.blit(text, text_rect)
-        text = font.render(chr(97 + i), True, WHITE)
-        text_rect = text.get_rect(center=(board_x + i * square_size + square_size / 2, board_y + board_size + 20))
-        window.blit(text, text_rect)
+        text = render_text(str(8 - i), WHITE)
+        text_rect = text.get_rect(center=(20, board_y - int(board_y) + i * square_size + square_size / 2))
+        surface.blit(text, text_rect)
+        text = render_text(chr(97 + i), WHITE)
+        text_rect = text.get_rect(center=(board_x - int(left) + i * square_size + square_size / 2, board_y - int(board_y) + board_size + 20))
+        surface.blit(text, text_rect)
+    return surface
+
+label_layer = Layer(render_label_layer)
+
+def side_panel_rect():
+    # The side panel covers everything to the right of the board
+    board_x, board_y, board_size = board_geometry()
+    panel_left = int(board_x + board_size) + 2
+    return pygame.Rect(panel_left, 0, max(window_width - panel_left, 0), window_height)
+
+def render_side_panel(panel_left):
+    surface = pygame.Surface((max(window_width - panel_left, 0), window_height))
+    surface.fill(BACKGROUND)
 
     # Render text to the right hand side of the screen
     if active_colour == 'w':
-        text = font.render("White to move", True, WHITE)
+        text = render_text("White to move", WHITE)
         text_rect = text.get_rect()
-        text_rect.center = (window_width * (7/8), 50)
-        window.blit(text, text_rect)
+        text_rect.center = (window_width * (7/8) - panel_left, 50)
+        surface.blit(text, text_rect)
     elif active_colour == 'b':
-        text = font.render("Black to move", True, WHITE)
+        text = render_text("Black to move", WHITE)
         text_rect = text.get_rect()
-        text_rect.center = (window_width * (7/8), 50)
-        window.blit(text, text_rect)
+        text_rect.center = (window_width * (7/8) - panel_left, 50)
+        surface.blit(text, text_rect)
 
     if castling != '-':
         if 'K' in castling:
-            text = font.render("Kingside Castling available", True, WHITE)
+            text = render_text("Kingside Castling available", WHITE)
             text_rect = text.get_rect()
-            text_rect.center = (window_width * (7/8), 100)
-            window.blit(text, text_rect)
+            text_rect.center = (window_width * (7/8) - panel_left, 100)
+            surface.blit(text, text_rect)
         if 'k' in castling:
-            text = font.render("Queenside Castling available", True, WHITE)
+            text = render_text("Queenside Castling available", WHITE)
             text_rect = text.get_rect()
-            text_rect.center = (window_width * (7/8), 150)
-            window.blit(text, text_rect)
+            text_rect.center = (window_width * (7/8) - panel_left, 150)
+            surface.blit(text, text_rect)
         if 'Q' in castling:
-            text = font.render("Kingside Castling available", True, WHITE)
+            text = render_text("Kingside Castling available", WHITE)
             text_rect = text.get_rect()
-            text_rect.center = (window_width * (7/8), 200)
-            window.blit(text, text_rect)
+            text_rect.center = (window_width * (7/8) - panel_left, 200)
+            surface.blit(text, text_rect)
         if 'q' in castling:
-            text = font.render("Queenside Castling available", True, WHITE)
+            text = render_text("Queenside Castling available", WHITE)
             text_rect = text.get_rect()
-            text_rect.center = (window_width * (7/8), 250)
-            window.blit(text, text_rect)
+            text_rect.center = (window_width * (7/8) - panel_left, 250)
+            surface.blit(text, text_rect)
     elif castling == '-':
-        text = font.render("No Castling available", True, WHITE)
+        text = render_text("No Castling available", WHITE)
         text_rect = text.get_rect()
-        text_rect.center = (window_width * (7/8), 100)
-        window.blit(text, text_rect)
+        text_rect.center = (window_width * (7/8) - panel_left, 100)
+        surface.blit(text, text_rect)
 
     if en_passant != '-':
-        text = font.render(f"En passant square: {en_passant}", True, WHITE)
+        text = render_text(f"En passant square: {en_passant}", WHITE)
         text_rect = text.get_rect()
-        text_rect.center = (window_width * (7/8), 300)
-        window.blit(text, text_rect)
+        text_rect.center = (window_width * (7/8) - panel_left, 300)
+        surface.blit(text, text_rect)
     elif en_passant == '-':
-        text = font.render("No en passant square", True, WHITE)
+        text = render_text("No en passant square", WHITE)
         text_rect = text.get_rect()
-        text_rect.center = (window_width * (7/8), 300)
-        window.blit(text, text_rect)
+        text_rect.center = (window_width * (7/8) - panel_left, 300)
+        surface.blit(text, text_rect)
 
-    text = font.render(f"Halfmove: {halfmove}", True, WHITE)
+    text = render_text(f"Halfmove: {halfmove}", WHITE)
     text_rect = text.get_rect()
-    text_rect.center = (window_width * (7/8), 350)
-    window.blit(text, text_rect)
+    text_rect.center = (window_width * (7/8) - panel_left, 350)
+    surface.blit(text, text_rect)
 
-    text = font.render(f"Fullmove: {fullmove}", True, WHITE)
+    text = render_text(f"Fullmove: {fullmove}", WHITE)
     text_rect = text.get_rect()
-    text_rect.center = (window_width * (7/8), 400)
-    window.blit(text, text_rect)
+    text_rect.center = (window_width * (7/8) - panel_left, 400)
+    surface.blit(text, text_rect)
 
-def check_valid_moves(piece, position, square, en_passant=None):
-    valid_moves = []
+    if engine_line is not None:
+        depth, score, line = engine_line
+        text = render_text(f"Depth {depth}: {score}", WHITE)
+        text_rect = text.get_rect()
+        text_rect.center = (window_width * (7/8) - panel_left, 450)
+        surface.blit(text, text_rect)
 
-    def within_bounds(new_square):
-        return 0 <= new_square < 64
-    
-    def is_opponent(piece, target):
-        if target is None:
-            return False
-        if piece.islower() and target.isupper():
-            return True
-        if piece.isupper() and target.islower():
-            return True
-        return False
-
-    if piece == 'p':
-        if within_bounds(square + 8) and position[square + 8] is None:
-            valid_moves.append(square + 8)
-            if square < 16 and within_bounds(square + 16) and position[square + 16] is None:
-                valid_moves.append(square + 16)
-        if square % 8 != 0 and within_bounds(square + 7) and (is_opponent(piece, position[square + 7]) or en_passant_index == square + 7):
-            valid_moves.append(square + 7)
-        if square % 8 != 7 and within_bounds(square + 9) and (is_opponent(piece, position[square + 9]) or en_passant_index == square + 9):
-            valid_moves.append(square + 9)
-    
-    if piece == 'P':
-        if within_bounds(square - 8) and position[square - 8] is None:
-            valid_moves.append(square - 8)
-            if square > 47 and within_bounds(square - 16) and position[square - 16] is None:
-                valid_moves.append(square - 16)
-        if square % 8 != 0 and within_bounds(square - 9) and (is_opponent(piece, position[square - 9]) or en_passant_index == square - 9):
-            valid_moves.append(square - 9)
-        if square % 8 != 7 and within_bounds(square - 7) and (is_opponent(piece, position[square - 7]) or en_passant_index == square - 7):
-            valid_moves.append(square - 7)
-
-    if piece == 'Q' or piece == 'q' or piece == 'R' or piece == 'r':
-        # Vertical and horizontal moves for rooks and queens
-        for i in range(1, 8):
-            new_square = square + i * 8
-            if within_bounds(new_square):
-                if position[new_square] is None:
-                    valid_moves.append(new_square)
-                else:
-                    if is_opponent(piece, position[new_square]):
-                        valid_moves.append(new_square)
-                    break
-            else:
-                break
-        for i in range(1, 8):
-            new_square = square - i * 8
-            if within_bounds(new_square):
-                if position[new_square] is None:
-                    valid_moves.append(new_square)
-                else:
-                    if is_opponent(piece, position[new_square]):
-                        valid_moves.append(new_square)
-                    break
-            else:
-                break
-        for i in range(1, 8):
-            new_square = square + i
-            if within_bounds(new_square) and square // 8 == new_square // 8:
-                if position[new_square] is None:
-                    valid_moves.append(new_square)
-                else:
-                    if is_opponent(piece, position[new_square]):
-                        valid_moves.append(new_square)
-                    break
-            else:
-                break
-        for i in range(1, 8):
-            new_square = square - i
-            if within_bounds(new_square) and square // 8 == new_square // 8:
-                if position[new_square] is None:
-                    valid_moves.append(new_square)
-                else:
-                    if is_opponent(piece, position[new_square]):
-                        valid_moves.append(new_square)
-                    break
-            else:
-                break
-
-    if piece == 'Q' or piece == 'q' or piece == 'B' or piece == 'b':
-        # Diagonal moves for bishops and queens
-        for i in range(1, 8):
-            new_square = square + i * 7
-            if within_bounds(new_square) and new_square % 8 < square % 8:
-                if position[new_square] is None:
-                    valid_moves.append(new_square)
-                else:
-                    if is_opponent(piece, position[new_square]):
-                        valid_moves.append(new_square)
-                    break
-            else:
-                break
-        for i in range(1, 8):
-            new_square = square + i * 9
-            if within_bounds(new_square) and new_square % 8 > square % 8:
-                if position[new_square] is None:
-                    valid_moves.append(new_square)
-                else:
-                    if is_opponent(piece, position[new_square]):
-                        valid_moves.append(new_square)
-                    break
-            else:
-                break
-        for i in range(1, 8):
-            new_square = square - i * 7
-            if within_bounds(new_square) and new_square % 8 > square % 8:
-                if position[new_square] is None:
-                    valid_moves.append(new_square)
-                else:
-                    if is_opponent(piece, position[new_square]):
-                        valid_moves.append(new_square)
-                    break
-            else:
-                break
-        for i in range(1, 8):
-            new_square = square - i * 9
-            if within_bounds(new_square) and new_square % 8 < square % 8:
-                if position[new_square] is None:
-                    valid_moves.append(new_square)
-                else:
-                    if is_opponent(piece, position[new_square]):
-                        valid_moves.append(new_square)
-                    break
-            else:
-                break
-
-    if piece == 'N' or piece == 'n':
-        file = square % 8
-        rank = square // 8
-
-        knight_moves = [
-            (square + 17, file < 7 and rank < 6),
-            (square + 15, file > 0 and rank < 6),
-            (square + 10, file < 6 and rank < 7),
-            (square + 6, file > 1 and rank < 7),
-            (square - 6, file < 7 and rank > 0),
-            (square - 10, file > 1 and rank > 0),
-            (square - 15, file < 7 and rank > 1),
-            (square - 17, file > 0 and rank > 1)
-        ]
-
-        for move, condition in knight_moves:
-            if within_bounds(move) and condition:
-                new_file = move % 8
-                new_rank = move // 8
-                if (position[move] is None or is_opponent(piece, position[move])) and abs(rank - new_rank) <= 2 and abs(file - new_file) <= 2:
-                    valid_moves.append(move)
-
-    if piece == 'K' or piece == 'k':
-        king_moves = [
-            square + 8, square + 9, square + 1, square - 7,
-            square - 8, square - 9, square - 1, square + 7
-        ]
-        for move in king_moves:
-            if within_bounds(move):
-                if position[move] is None or is_opponent(piece, position[move]):
-                    valid_moves.append(move)
-
-        if piece.isupper():
-            if 'K' in castling:
-                if position[5] is None and position[62] is None:
-                    valid_moves.append(62)
-            if 'Q' in castling:
-                if position[1] is None and position[58] is None and position[59] is None:
-                    valid_moves.append(58)
-        elif piece.islower():
-            if 'k' in castling:
-                if position[61] is None and position[6] is None:
-                    valid_moves.append(6)
-            if 'q' in castling:
-                if position[57] is None and position[2] is None and position[3] is None:
-                    valid_moves.append(2)
-
-    return valid_moves
-
-def promote_pawn(position, square, promotion_piece):
-    position[square] = promotion_piece
+        text = render_text(line, WHITE)
+        text_rect = text.get_rect()
+        text_rect.center = (window_width * (7/8) - panel_left, 475)
+        surface.blit(text, text_rect)
+
+    text = render_text(engine_status or "Space: computer move, A: analyse", GREY)
+    text_rect = text.get_rect()
+    text_rect.center = (window_width * (7/8) - panel_left, 525)
+    surface.blit(text, text_rect)
+
+    return surface
+
+side_panel_layer = Layer(render_side_panel)
+
+def side_panel_key():
+    return (active_colour, castling, en_passant, halfmove, fullmove, engine_line, engine_status, window_width, window_height)
+
+def draw_side_panel():
+    # Blit the side panel, re-rendering it only if the game state it shows has changed
+    rect = side_panel_rect()
+    window.blit(side_panel_layer.get(side_panel_key(), rect.x), rect)
+    return rect
+
+def draw_game():
+    # Clear the screen
+    window.fill(BACKGROUND)
+
+    # Calculate the board size and position
+    board_x, board_y, board_size = board_geometry()
+
+    # Draw the labels, board and pieces
+    window.blit(label_layer.get((board_x, board_y, board_size), board_x, board_y, board_size), (int(board_x - 40), int(board_y)))
+    draw_board(board_x, board_y, board_size)
+    draw_pieces(position, board_x, board_y, board_size)
+
+    # Draw the text to the right hand side of the screen
+    draw_side_panel()
+
+def score_text(score, colour):
+    # Engine scores are from the side to move's point of view; show them from white's, in pawns or moves to mate
+    if colour == 'b':
+        score = -score
+    if abs(score) > MATE_BOUND:
+        return f"{'' if score > 0 else '-'}M{(MATE_SCORE - abs(score) + 1) // 2}"
+    return f"{score / 100:+.2f}"
+
+def apply_move(move):
+    # Play a move on the board, returning the squares whose contents changed.
+    # Castling and en passant also change squares other than the move's own two.
+    before = list(position)
+    board.make_move(move)
+    sync_game_state()
+    return {square for square in range(64) if position[square] != before[square]}
 
 def draw_valid_moves(valid_moves, board_x, board_y, square_size):
     for move in valid_moves:
@@ -419,114 +382,229 @@ def draw_valid_moves(valid_moves, board_x, board_y, square_size):
         y = board_y + i * square_size + square_size / 2
         pygame.draw.circle(window, GREY, (int(x), int(y)), int(square_size / 4), 50)
 
+def draw_square(index, board_x, board_y, square_size, highlighted=False, marked=False):
+    # Redraw a single square and everything on it, returning the rect that changed
+    i = index // 8
+    j = index % 8
+    left = int(board_x + j * square_size)
+    top = int(board_y + i * square_size)
+    rect = pygame.Rect(left, top, int(board_x + (j + 1) * square_size) - left + 1, int(board_y + (i + 1) * square_size) - top + 1)
+
+    # Clip to the square so nothing bleeds into its neighbours
+    window.set_clip(rect)
+    if highlighted:
+        window.fill(HIGHLIGHT, rect)
+    else:
+        draw_board(board_x, board_y, square_size * 8, rect)
+    piece = position[index]
+    if piece is not None:
+        window.blit(sprite_atlas.sprites_for(square_size)[piece], (board_x + j * square_size, board_y + i * square_size))
+    text = render_text(str(index), WHITE)
+    text_rect = text.get_rect(center=(board_x + j * square_size + 7, board_y + i * square_size + 7))
+    window.blit(text, text_rect)
+    if marked:
+        draw_valid_moves([index], board_x, board_y, square_size)
+    window.set_clip(None)
+    return rect
+
 def main():
     global window, window_width, window_height  # Declare window, window_width, and window_height as global variables
+    global engine_line, engine_status
     running = True
-    piece_selected = False
+    selected_square = None
+    valid_moves = []
+
+    # The engine searches in its own process. computer_colour is the side it plays, once Space has handed it one;
+    # computer_thinking is its move on the way, and analysing follows every position when it isn't playing.
+    engine = Engine()
+    computer_colour = None
+    computer_thinking = False
+    analysing = False
+    # The line the computer expects after its move, kept from its search for pondering
+    expected_line = []
+
+    init_display()
+    new_game()
 
-    # Mouse button state and debounce time
-    mouse_button_held = False
-    debounce_time = 0.2  # 200 milliseconds debounce time
-    last_click_time = 0
+    # Mouse movement never changes the picture, so don't wake up for it
+    pygame.event.set_blocked(pygame.MOUSEMOTION)
 
     draw_game()
+    pygame.display.flip()
 
     while running:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                running = False
-            elif event.type == pygame.VIDEORESIZE:
-                window_width, window_height = event.w, event.h
-                window = pygame.display.set_mode((window_width, window_height), pygame.RESIZABLE)
-                draw_game()
+        # Sleep until something happens instead of redrawing every frame,
+        # waking each frame while the engine is thinking to pick up its results
+        if engine.thinking:
+            event = pygame.event.wait(FRAME_TIME)
+        else:
+            event = pygame.event.wait()
 
-        # Get the mouse position
-        x, y = pygame.mouse.get_pos()
+        # Squares whose contents changed while handling this event, and whether the game moved on
+        dirty_squares = set()
+        position_changed = False
 
         # Calculate the board size and position
-        board_size = min(window_width, window_height) * 0.8  # Board takes 80% of the smaller dimension
-        board_x = 25 + window_width * 0.1
-        board_y = (window_height / 2 - board_size / 2)
-
-        # Calculating which square the mouse is on
+        board_x, board_y, board_size = board_geometry()
         square_size = board_size / 8
-        i = int((y - board_y) // square_size)
-        j = int((x - board_x) // square_size)
-
-        # Checks to see if mouse is on the board
-        if 0 <= i < 8 and 0 <= j < 8:
-
-            # If mouse is clicked, and there isn't currently a piece selected
-            if event.type == pygame.MOUSEBUTTONDOWN and piece_selected == False:
-                # If the click is a left click
-                if event.button == 1:
-                    # Registering the time to prevent many clicks happening at once
-                    current_time = time.time()
-                    if not mouse_button_held and (current_time - last_click_time > debounce_time):
-                        selected_square = i * 8 + j
-                        mouse_button_held = True
-                        last_click_time = current_time
-                        # Draws the board without pieces
-                        draw_board(board_x, board_y, board_size)
-                        # Highlights the selected square
-                        pygame.draw.rect(window, (219, 194, 70, 50), (board_x + j * square_size, board_y + i * square_size, square_size + 1, square_size + 1))
-                        # Draws the pieces over the board
-                        draw_pieces(position, board_x, board_y, board_size)
-                        # Draws a circle on the squares that have valid moves for the selected piece
-                        if selected_square is not None:
-                            draw_valid_moves(check_valid_moves(selected_square, position, i * 8 + j), board_x, board_y, square_size)
-                        # Registers that a piece has been selected if the square has a piece on it
-                        if selected_square is not None:
-                            piece_selected = True
-                        else:
-                            piece_selected = False
-
-            if event.type == pygame.MOUSEBUTTONUP:
-                if event.button == 1 and i * 8 + j != selected_square:
-                    mouse_button_held = False
-                    if piece_selected:
-                        if i * 8 + j in check_valid_moves(position[selected_square], position, selected_square, en_passant_index):
-                            position[i * 8 + j] = position[selected_square]
-                            position[selected_square] = None
-                            draw_game()
-                            piece_selected = False
-                        else:
-                            piece_selected = False
-                            draw_game()
-                    else:
-                        draw_game()
-            
-            # Highlight the current piece and valid moves
-            if event.type == pygame.MOUSEBUTTONDOWN and piece_selected is True:
-                if event.button == 3:
-                    current_time = time.time()
-                    if not mouse_button_held and (current_time - last_click_time > debounce_time):
-                        mouse_button_held = True
-                        last_click_time = current_time
-                        piece_selected = False
-                        draw_game()
-                if event.button == 1:
-                    current_time = time.time()
-                    if not mouse_button_held and (current_time - last_click_time > debounce_time):
-                        mouse_button_held = True
-                        last_click_time = current_time
-                        if position[i * 8 + j] in check_valid_moves(position[selected_square], position, selected_square, en_passant_index):
-                            print(f"Clicked position: {position[i * 8 + j]}, Valid Moves: {check_valid_moves(position[selected_square], position, selected_square, en_passant_index)}")
-                            position[i * 8 + j] = position[selected_square]
-                            position[selected_square] = None
-                        draw_game()
-                        piece_selected = False
-
-            # Check for mouse released event
-            if event.type == pygame.MOUSEBUTTONUP:
-                if event.button == 1 or event.button == 3:
-                    mouse_button_held = False
-                    
-        # Update the display
-        pygame.display.flip()
-        clock.tick(60)
 
+        if event.type == pygame.QUIT:
+            running = False
+
+        elif event.type == pygame.VIDEORESIZE:
+            window_width, window_height = event.w, event.h
+            window = pygame.display.set_mode((window_width, window_height), pygame.RESIZABLE)
+            # Rescale the sprites once for the new square size
+            board_x, board_y, board_size = board_geometry()
+            sprite_atlas.rebuild(board_size / 8)
+            draw_game()
+            # Put the current selection back on top of the fresh board
+            if selected_square is not None:
+                draw_square(selected_square, board_x, board_y, board_size / 8, highlighted=True)
+                for move in valid_moves:
+                    draw_square(move, board_x, board_y, board_size / 8, marked=True)
+            pygame.display.flip()
+
+        elif event.type == pygame.KEYDOWN and event.key == pygame.K_BACKSPACE:
+            # Backspace takes back the last move, and hands the computer's side back to the player
+            engine.cancel()
+            computer_thinking = False
+            computer_colour = None
+            if board.undo_stack:
+                board.unmake_move()
+                sync_game_state()
+                selected_square = None
+                valid_moves = []
+                position_changed = True
+                draw_game()
+                pygame.display.flip()
+
+        elif event.type == pygame.KEYDOWN and event.key == pygame.K_SPACE:
+            # Space makes the computer play the side to move from now on
+            if not computer_thinking and board.legal_moves():
+                computer_colour = active_colour
+                engine.start(board, movetime=COMPUTER_MOVETIME)
+                computer_thinking = True
+                if selected_square is not None:
+                    dirty_squares.add(selected_square)
+                    dirty_squares.update(valid_moves)
+                selected_square = None
+                valid_moves = []
+
+        elif event.type == pygame.KEYDOWN and event.key == pygame.K_a:
+            # A turns analysis of the current position on and off
+            analysing = not analysing
+            if computer_colour is None:
+                if analysing:
+                    engine.start(board)
+                else:
+                    engine.cancel()
+            if not analysing:
+                engine_line = None
+
+        elif event.type in (pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP) and not computer_thinking:
+            # Calculating which square the mouse is on
+            x, y = event.pos
+            i = int((y - board_y) // square_size)
+            j = int((x - board_x) // square_size)
+
+            # Checks to see if mouse is on the board
+            if 0 <= i < 8 and 0 <= j < 8:
+                clicked_square = i * 8 + j
+
+                # Left click with nothing selected picks up the piece on that square
+                if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1 and selected_square is None:
+                    piece = position[clicked_square]
+                    if piece is not None and piece.isupper() == (active_colour == 'w'):
+                        selected_square = clicked_square
+                        # Only offer moves that don't leave the king in check
+                        valid_moves = sorted({move_to(move) for move in board.legal_moves() if move_from(move) == selected_square})
+                        dirty_squares.add(selected_square)
+                        dirty_squares.update(valid_moves)
+
+                # Releasing on a different square, or clicking a second square, tries to move there
+                elif selected_square is not None and event.button == 1 and clicked_square != selected_square:
+                    dirty_squares.add(selected_square)
+                    dirty_squares.update(valid_moves)
+                    if clicked_square in valid_moves:
+                        # Pawns reaching the last rank become queens
+                        promotion = 0
+                        if position[selected_square] in ('P', 'p') and clicked_square // 8 in (0, 7):
+                            promotion = QUEEN
+                        move = encode_move(selected_square, clicked_square, promotion)
+                        dirty_squares.update(apply_move(move))
+                        position_changed = True
+                        if computer_colour == active_colour:
+                            if engine.ponder_move == move:
+                                # The expected reply: the search pondering on it just carries on against the clock
+                                engine.ponderhit()
+                            else:
+                                engine.start(board, movetime=COMPUTER_MOVETIME)
+                                engine_line = None
+                            computer_thinking = True
+                    dirty_squares.add(clicked_square)
+                    selected_square = None
+                    valid_moves = []
+
+                # Right click drops the selected piece
+                elif selected_square is not None and event.type == pygame.MOUSEBUTTONDOWN and event.button == 3:
+                    dirty_squares.add(selected_square)
+                    dirty_squares.update(valid_moves)
+                    selected_square = None
+                    valid_moves = []
+
+        # Pick up whatever the engine has sent since the last pass, without waiting for more
+        for message in engine.poll():
+            if message[0] == 'info':
+                kind, search_id, depth, score, best_move, pv, nodes, seconds = message
+                expected_line = pv
+                # Pondering reports on a position that hasn't happened yet, so it isn't shown
+                if engine.ponder_move is None:
+                    engine_line = (depth, score_text(score, active_colour), ' '.join(move_name(move) for move in pv[:5]))
+            elif message[0] == 'bestmove' and computer_thinking:
+                computer_thinking = False
+                best_move = message[2]
+                if best_move:
+                    dirty_squares.update(apply_move(best_move))
+                    position_changed = True
+                    # Spend the player's thinking time searching the reply the computer expects
+                    if len(expected_line) > 1 and expected_line[0] == best_move and expected_line[1] in board.legal_moves():
+                        engine.start(board, movetime=COMPUTER_MOVETIME, ponder_move=expected_line[1])
+                expected_line = []
+
+        # Analysis follows the game to every new position
+        if position_changed:
+            if not computer_thinking:
+                engine_line = None
+            if analysing and computer_colour is None:
+                engine.start(board)
+
+        if computer_thinking:
+            engine_status = "Computer thinking..."
+        elif engine.ponder_move is not None:
+            engine_status = f"Pondering {move_name(engine.ponder_move)}"
+        elif analysing:
+            engine_status = "Analysing"
+        else:
+            engine_status = ''
+
+        # Only push the squares that changed to the display
+        rects = []
+        for index in dirty_squares:
+            rects.append(draw_square(index, board_x, board_y, square_size, index == selected_square, index in valid_moves))
+        # The side panel only needs pushing if what it shows has changed
+        if not side_panel_layer.is_current(side_panel_key()):
+            rects.append(draw_side_panel())
+        if rects:
+            pygame.display.update(rects)
+
+    engine.close()
     pygame.quit()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if '--uci' in sys.argv[1:]:
+        # Play over UCI on stdin and stdout instead, with no window (see uci.py)
+        import uci
+        uci.main()
+    else:
+        main()
\ No newline at end of file
@@ -0,0 +1,167 @@
+# Game logic with no pygame in it: FEN files, square names and move generation
+#
+# chess.py draws the game on top of this, but nothing here needs a display,
+# so scripts and batch workers can import it in a few milliseconds on a
+# machine without one.
+
+import os
+
+def read_fen_position(fen_filepath):
+    # Get the directory of the current script
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+
+    # Define the path to the other file
+    file_path = os.path.join(script_dir, 'Positions', fen_filepath)
+
+    # Open and read the file
+    with open(file_path, 'r') as file:
+        fen = file.read()
+
+    params = fen.split(' ')
+    fen = params[0]
+    active_colour = params[1]
+    castling = params[2]
+    en_passant = params[3]
+    halfmove = params[4]
+    fullmove = params[5]
+
+    ranks = fen.split('/')
+    position = []
+    for rank in ranks:
+        for char in rank:
+            if char.isdigit():
+                for i in range(int(char)):
+                    position.append(None)
+            else:
+                position.append(char)
+    return position, active_colour, castling, en_passant, halfmove, fullmove
+
+# map the grid notation to the board index
+grid_to_index = {
+    'a8': 0, 'b8': 1, 'c8': 2, 'd8': 3, 'e8': 4, 'f8': 5, 'g8': 6, 'h8': 7,
+    'a7': 8, 'b7': 9, 'c7': 10, 'd7': 11, 'e7': 12, 'f7': 13, 'g7': 14, 'h7': 15,
+    'a6': 16, 'b6': 17, 'c6': 18, 'd6': 19, 'e6': 20, 'f6': 21, 'g6': 22, 'h6': 23,
+    'a5': 24, 'b5': 25, 'c5': 26, 'd5': 27, 'e5': 28, 'f5': 29, 'g5': 30, 'h5': 31,
+    'a4': 32, 'b4': 33, 'c4': 34, 'd4': 35, 'e4': 36, 'f4': 37, 'g4': 38, 'h4': 39,
+    'a3': 40, 'b3': 41, 'c3': 42, 'd3': 43, 'e3': 44, 'f3': 45, 'g3': 46, 'h3': 47,
+    'a2': 48, 'b2': 49, 'c2': 50, 'd2': 51, 'e2': 52, 'f2': 53, 'g2': 54, 'h2': 55,
+    'a1': 56, 'b1': 57, 'c1': 58, 'd1': 59, 'e1': 60, 'f1': 61, 'g1': 62, 'h1': 63
+}
+
+# Precompute where each piece can go from every square, so move generation only walks tables
+def build_ray(square, file_step, rank_step):
+    ray = []
+    file = square % 8 + file_step
+    rank = square // 8 + rank_step
+    while 0 <= file < 8 and 0 <= rank < 8:
+        ray.append(rank * 8 + file)
+        file += file_step
+        rank += rank_step
+    return tuple(ray)
+
+def build_jumps(square, steps):
+    targets = []
+    for file_step, rank_step in steps:
+        file = square % 8 + file_step
+        rank = square // 8 + rank_step
+        if 0 <= file < 8 and 0 <= rank < 8:
+            targets.append(rank * 8 + file)
+    return tuple(targets)
+
+# Directions as (file step, rank step); rank 0 is the top of the board (rank 8)
+ROOK_DIRECTIONS = ((0, 1), (0, -1), (1, 0), (-1, 0))
+BISHOP_DIRECTIONS = ((-1, 1), (1, 1), (1, -1), (-1, -1))
+KNIGHT_STEPS = ((1, 2), (-1, 2), (2, 1), (-2, 1), (2, -1), (-2, -1), (1, -2), (-1, -2))
+KING_STEPS = ROOK_DIRECTIONS + BISHOP_DIRECTIONS
+
+# RAYS[square] holds the 8 rays leaving that square, rook directions first
+RAYS = tuple(tuple(build_ray(square, file_step, rank_step) for file_step, rank_step in KING_STEPS) for square in range(64))
+ROOK_RAYS = tuple(rays[:4] for rays in RAYS)
+BISHOP_RAYS = tuple(rays[4:] for rays in RAYS)
+KNIGHT_TARGETS = tuple(build_jumps(square, KNIGHT_STEPS) for square in range(64))
+KING_TARGETS = tuple(build_jumps(square, KING_STEPS) for square in range(64))
+PAWN_CAPTURES = {
+    'P': tuple(build_jumps(square, ((-1, -1), (1, -1))) for square in range(64)),
+    'p': tuple(build_jumps(square, ((-1, 1), (1, 1))) for square in range(64))
+}
+
+def check_valid_moves(piece, position, square, en_passant_index=-1, castling='-'):
+    # Target squares of the piece on square, checking only for pieces in the way, not for check.
+    # en_passant_index is the en passant target square, -1 for none, and castling the FEN castling field.
+    valid_moves = []
+
+    def is_opponent(piece, target):
+        if target is None:
+            return False
+        if piece.islower() and target.isupper():
+            return True
+        if piece.isupper() and target.islower():
+            return True
+        return False
+
+    if piece == 'p':
+        if square < 56 and position[square + 8] is None:
+            valid_moves.append(square + 8)
+            if square < 16 and position[square + 16] is None:
+                valid_moves.append(square + 16)
+        for move in PAWN_CAPTURES[piece][square]:
+            if is_opponent(piece, position[move]) or en_passant_index == move:
+                valid_moves.append(move)
+
+    if piece == 'P':
+        if square > 7 and position[square - 8] is None:
+            valid_moves.append(square - 8)
+            if square > 47 and position[square - 16] is None:
+                valid_moves.append(square - 16)
+        for move in PAWN_CAPTURES[piece][square]:
+            if is_opponent(piece, position[move]) or en_passant_index == move:
+                valid_moves.append(move)
+
+    if piece == 'Q' or piece == 'q':
+        rays = RAYS[square]
+    elif piece == 'R' or piece == 'r':
+        rays = ROOK_RAYS[square]
+    elif piece == 'B' or piece == 'b':
+        rays = BISHOP_RAYS[square]
+    else:
+        rays = ()
+
+    # Slide along each ray until something is in the way
+    for ray in rays:
+        for new_square in ray:
+            if position[new_square] is None:
+                valid_moves.append(new_square)
+            else:
+                if is_opponent(piece, position[new_square]):
+                    valid_moves.append(new_square)
+                break
+
+    if piece == 'N' or piece == 'n':
+        for move in KNIGHT_TARGETS[square]:
+            if position[move] is None or is_opponent(piece, position[move]):
+                valid_moves.append(move)
+
+    if piece == 'K' or piece == 'k':
+        for move in KING_TARGETS[square]:
+            if position[move] is None or is_opponent(piece, position[move]):
+                valid_moves.append(move)
+
+        if piece.isupper():
+            if 'K' in castling:
+                if position[61] is None and position[62] is None:
+                    valid_moves.append(62)
+            if 'Q' in castling:
+                if position[57] is None and position[58] is None and position[59] is None:
+                    valid_moves.append(58)
+        elif piece.islower():
+            if 'k' in castling:
+                if position[5] is None and position[6] is None:
+                    valid_moves.append(6)
+            if 'q' in castling:
+                if position[1] is None and position[2] is None and position[3] is None:
+                    valid_moves.append(2)
+
+    return valid_moves
+
+def promote_pawn(position, square, promotion_piece):
+    position[square] = promotion_piece
@@ -0,0 +1,205 @@
+# Background engine: the search running in its own process, driven through queues
+#
+# The pygame loop mustn't block on a search, and threads can't search in
+# parallel with it under the GIL, so the Searcher lives in a child process.
+# The UI side only ever puts commands on one queue and takes results off
+# another without waiting:
+#
+#   commands  ('position', search_id, fen, moves, depth, movetime, nodes, ponder)
+#                  search a new position, stopping whatever was running
+#             ('ponderhit', search_id)
+#                  the pondered move was played, so start the clock
+#             ('stop', search_id)   stop searching, reporting the best move so far
+#             ('quit',)
+#   results   ('info', search_id, depth, score, best_move, pv, nodes, seconds)
+#                  after every completed depth
+#             ('bestmove', search_id, best_move, score)
+#                  when a search ends, however it ended
+#
+# A ponder search looks at the position after the opponent's expected reply
+# while they are still thinking. It runs without limits, and even if it ends
+# early its bestmove is held back. If the reply is played, ponderhit gives it
+# its movetime from that moment and it carries on as the real search, with
+# everything already searched kept. Any other move just sends a new position,
+# which stops it; the transposition table still keeps what it found.
+#
+# Scores are from the side to move's point of view. Every position sent gets
+# a new search_id, and Engine.poll drops results from older ones, so the UI
+# never sees analysis of a position it has moved on from.
+#
+#   engine = Engine()
+#   engine.start(board, movetime=2.0)
+#   for message in engine.poll(): ...   # once a frame
+
+import multiprocessing
+import queue
+import threading
+import time
+
+from bitboard import Board
+from search import Searcher
+from transposition import TranspositionTable
+
+def engine_process(commands, results, hash_mb):
+    # Runs in the child process until it gets 'quit'
+    pending = queue.Queue()
+    running = [None]
+    # The id and movetime of the search that is pondering, until a ponderhit or anything else ends that
+    ponder = [None, None]
+    # Taken by the reader while it queues a command and stops the running search, and by the
+    # search loop while it publishes a new searcher, so a command can't slip in between the two
+    lock = threading.Lock()
+
+    def read_commands():
+        # Pass commands on to the search loop and stop the running search for any but ponderhit
+        while True:
+            command = commands.get()
+            with lock:
+                pending.put(command)
+                searcher = running[0]
+                if command[0] == 'ponderhit':
+                    # The expected move was played: the search carries on, now against the clock
+                    if ponder[0] == command[1]:
+                        if ponder[1] is not None:
+                            searcher.set_time_limit(ponder[1])
+                        ponder[0] = None
+                elif searcher is not None:
+                    searcher.stop()
+            if command[0] == 'quit':
+                return
+
+    threading.Thread(target=read_commands, daemon=True).start()
+    tt = TranspositionTable(hash_mb)
+    # A finished ponder search's (search_id, best_move, score), kept back until a ponderhit or stop asks for it
+    held = None
+    while True:
+        command = pending.get()
+        # Set when a stop for this position came in before its search could start
+        stop_at_once = False
+        # Only the newest command matters when several have piled up, unless one of them is quit
+        while not pending.empty() and command[0] != 'quit':
+            if held is not None and command[0] in ('ponderhit', 'stop') and command[-1] == held[0]:
+                results.put(('bestmove',) + held)
+                held = None
+            following = pending.get()
+            if command[0] == 'position' and following[0] in ('ponderhit', 'stop') and following[-1] == command[1]:
+                # The search still has to send its bestmove: on the clock after a ponderhit, straight away after a stop
+                command = command[:-1] + (False,)
+                stop_at_once = stop_at_once or following[0] == 'stop'
+                continue
+            command = following
+        if command[0] == 'quit':
+            return
+        if command[0] in ('ponderhit', 'stop'):
+            if held is not None and command[-1] == held[0]:
+                results.put(('bestmove',) + held)
+                held = None
+            continue
+
+        # A new position: whatever was pondered before is no use now
+        held = None
+        kind, search_id, fen, moves, depth, movetime, nodes, pondering = command
+        board = Board.from_fen(fen)
+        for move in moves:
+            board.make_move(move)
+        searcher = Searcher(board, tt=tt)
+
+        def report(current, score, best_move, searcher):
+            pv = searcher.principal_variation()
+            results.put(('info', search_id, current, score, best_move, pv, searcher.nodes, time.perf_counter() - searcher.start_time))
+
+        limits = (depth, movetime, nodes)
+        if pondering:
+            # Search without limits until the ponderhit gives it movetime
+            limits = (None, None, None)
+        if stop_at_once:
+            searcher.stop()
+        with lock:
+            # Commands that came in while the searcher was being set up had nothing to stop yet
+            for waiting in pending.queue:
+                if waiting[0] != 'ponderhit':
+                    searcher.stop()
+                elif waiting[1] == search_id and pondering:
+                    # The reply was played before the search started: it goes on the clock straight away
+                    pondering = False
+                    limits = (depth, movetime, nodes)
+            if pondering:
+                ponder[0] = search_id
+                ponder[1] = movetime
+            running[0] = searcher
+        try:
+            best_move, score = searcher.search(*limits, on_iteration=report)
+        finally:
+            with lock:
+                running[0] = None
+        with lock:
+            still_pondering = ponder[0] == search_id
+            ponder[0] = None
+        if still_pondering:
+            # Nothing is allowed to come back from pondering until the opponent's move is known
+            held = (search_id, best_move, score)
+        else:
+            results.put(('bestmove', search_id, best_move, score))
+
+class Engine:
+    def __init__(self, hash_mb=16):
+        self.commands = multiprocessing.Queue()
+        self.results = multiprocessing.Queue()
+        self.process = multiprocessing.Process(target=engine_process, args=(self.commands, self.results, hash_mb), daemon=True)
+        self.process.start()
+        self.search_id = 0
+        # True from start() until the bestmove of that search comes back
+        self.thinking = False
+        # The opponent's move being pondered on, until ponderhit() or another start()
+        self.ponder_move = None
+
+    def start(self, board, depth=None, movetime=None, nodes=None, ponder_move=None):
+        # Start searching board, with no limits meaning analyse until stopped. Returns the search id.
+        # With ponder_move, search the position after that reply instead, ignoring the limits until
+        # ponderhit() says the reply was played and starts the clock.
+        self.search_id += 1
+        fen, moves = board.history()
+        if ponder_move is not None:
+            moves.append(ponder_move)
+        self.commands.put(('position', self.search_id, fen, moves, depth, movetime, nodes, ponder_move is not None))
+        self.thinking = True
+        self.ponder_move = ponder_move
+        return self.search_id
+
+    def ponderhit(self):
+        # The pondered move was played: the search carries on as the real one with the same id
+        if self.ponder_move is not None:
+            self.commands.put(('ponderhit', self.search_id))
+            self.ponder_move = None
+
+    def stop(self):
+        # The search still sends its bestmove, which poll() returns as usual
+        if self.thinking:
+            self.commands.put(('stop', self.search_id))
+
+    def cancel(self):
+        # Stop and forget the current search, so nothing more comes back from it
+        self.stop()
+        self.search_id += 1
+        self.thinking = False
+        self.ponder_move = None
+
+    def poll(self):
+        # Every result of the current search that has arrived, without waiting
+        messages = []
+        while True:
+            try:
+                message = self.results.get_nowait()
+            except queue.Empty:
+                return messages
+            if message[1] != self.search_id:
+                continue
+            if message[0] == 'bestmove':
+                self.thinking = False
+            messages.append(message)
+
+    def close(self):
+        self.commands.put(('quit',))
+        self.process.join(1.0)
+        if self.process.is_alive():
+            self.process.terminate()
@@ -0,0 +1,153 @@
+# Static evaluation: material plus piece-square tables
+#
+# Every piece is worth its material value plus a bonus or penalty for the
+# square it stands on. The king gets separate middlegame and endgame tables,
+# and the two totals are blended by how much material is left (the phase).
+#
+# Board keeps the middlegame and endgame totals and the phase up to date in
+# its put_piece, remove_piece and move_piece primitives (bitboard.py), the same
+# way as the Zobrist key, so evaluate() never has to look at the squares.
+# evaluate_position computes the same score from scratch for checking.
+#
+# On top of that comes the pawn structure from pawns.py, looked up in a pawn
+# hash table when one is given.
+
+from pawns import pawn_structure
+
+PIECE_VALUES = (100, 320, 330, 500, 900, 0)
+
+# Tables are from white's point of view, a8 first like the squares list.
+# Black uses the same tables flipped vertically.
+PAWN_TABLE = (
+      0,   0,   0,   0,   0,   0,   0,   0,
+     50,  50,  50,  50,  50,  50,  50,  50,
+     10,  10,  20,  30,  30,  20,  10,  10,
+      5,   5,  10,  25,  25,  10,   5,   5,
+      0,   0,   0,  20,  20,   0,   0,   0,
+      5,  -5, -10,   0,   0, -10,  -5,   5,
+      5,  10,  10, -20, -20,  10,  10,   5,
+      0,   0,   0,   0,   0,   0,   0,   0
+)
+KNIGHT_TABLE = (
+    -50, -40, -30, -30, -30, -30, -40, -50,
+    -40, -20,   0,   0,   0,   0, -20, -40,
+    -30,   0,  10,  15,  15,  10,   0, -30,
+    -30,   5,  15,  20,  20,  15,   5, -30,
+    -30,   0,  15,  20,  20,  15,   0, -30,
+    -30,   5,  10,  15,  15,  10,   5, -30,
+    -40, -20,   0,   5,   5,   0, -20, -40,
+    -50, -40, -30, -30, -30, -30, -40, -50
+)
+BISHOP_TABLE = (
+    -20, -10, -10, -10, -10, -10, -10, -20,
+    -10,   0,   0,   0,   0,   0,   0, -10,
+    -10,   0,   5,  10,  10,   5,   0, -10,
+    -10,   5,   5,  10,  10,   5,   5, -10,
+    -10,   0,  10,  10,  10,  10,   0, -10,
+    -10,  10,  10,  10,  10,  10,  10, -10,
+    -10,   5,   0,   0,   0,   0,   5, -10,
+    -20, -10, -10, -10, -10, -10, -10, -20
+)
+ROOK_TABLE = (
+      0,   0,   0,   0,   0,   0,   0,   0,
+      5,  10,  10,  10,  10,  10,  10,   5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+      0,   0,   0,   5,   5,   0,   0,   0
+)
+QUEEN_TABLE = (
+    -20, -10, -10,  -5,  -5, -10, -10, -20,
+    -10,   0,   0,   0,   0,   0,   0, -10,
+    -10,   0,   5,   5,   5,   5,   0, -10,
+     -5,   0,   5,   5,   5,   5,   0,  -5,
+      0,   0,   5,   5,   5,   5,   0,  -5,
+    -10,   5,   5,   5,   5,   5,   0, -10,
+    -10,   0,   5,   0,   0,   0,   0, -10,
+    -20, -10, -10,  -5,  -5, -10, -10, -20
+)
+# The king hides behind its pawns while there are pieces about, and heads for the centre once they're gone
+KING_MIDDLEGAME_TABLE = (
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -20, -30, -30, -40, -40, -30, -30, -20,
+    -10, -20, -20, -20, -20, -20, -20, -10,
+     20,  20,   0,   0,   0,   0,  20,  20,
+     20,  30,  10,   0,   0,  10,  30,  20
+)
+KING_ENDGAME_TABLE = (
+    -50, -40, -30, -20, -20, -30, -40, -50,
+    -30, -20, -10,   0,   0, -10, -20, -30,
+    -30, -10,  20,  30,  30,  20, -10, -30,
+    -30, -10,  30,  40,  40,  30, -10, -30,
+    -30, -10,  30,  40,  40,  30, -10, -30,
+    -30, -10,  20,  30,  30,  20, -10, -30,
+    -30, -30,   0,   0,   0,   0, -30, -30,
+    -50, -30, -30, -30, -30, -30, -30, -50
+)
+
+MIDDLEGAME_TABLES = (PAWN_TABLE, KNIGHT_TABLE, BISHOP_TABLE, ROOK_TABLE, QUEEN_TABLE, KING_MIDDLEGAME_TABLE)
+ENDGAME_TABLES = (PAWN_TABLE, KNIGHT_TABLE, BISHOP_TABLE, ROOK_TABLE, QUEEN_TABLE, KING_ENDGAME_TABLE)
+
+# Phase runs from MAX_PHASE with all the pieces on the board down to 0 with only kings and pawns
+PHASE_WEIGHTS = (0, 1, 1, 2, 4, 0)
+MAX_PHASE = 24
+
+def build_square_scores(tables):
+    # Material plus table value for each piece character on each square, negative for black
+    scores = {}
+    for kind, table in enumerate(tables):
+        white = 'PNBRQK'[kind]
+        black = 'pnbrqk'[kind]
+        scores[white] = tuple(PIECE_VALUES[kind] + table[square] for square in range(64))
+        # Square ^ 56 is the same square seen from the other side of the board
+        scores[black] = tuple(-(PIECE_VALUES[kind] + table[square ^ 56]) for square in range(64))
+    return scores
+
+MIDDLEGAME_SCORES = build_square_scores(MIDDLEGAME_TABLES)
+ENDGAME_SCORES = build_square_scores(ENDGAME_TABLES)
+PHASE_VALUES = {piece: PHASE_WEIGHTS['PNBRQKpnbrqk'.index(piece) % 6] for piece in 'PNBRQKpnbrqk'}
+
+def taper(middlegame, endgame, phase):
+    # Blend the two scores by the phase, more than MAX_PHASE (extra queens) counting as a full middlegame
+    phase = min(phase, MAX_PHASE)
+    return (middlegame * phase + endgame * (MAX_PHASE - phase)) // MAX_PHASE
+
+def evaluate(board, pawn_table=None):
+    # Score of a bitboard.Board from the side to move's point of view, from its running totals.
+    # pawn_table is a pawns.PawnHashTable; without one the pawn structure is worked out every time.
+    if pawn_table is not None:
+        pawn_middlegame, pawn_endgame = pawn_table.probe(board.pawn_hash, board.pieces[0], board.pieces[6])
+    else:
+        pawn_middlegame, pawn_endgame = pawn_structure(board.pieces[0], board.pieces[6])
+    score = taper(board.middlegame + pawn_middlegame, board.endgame + pawn_endgame, board.phase)
+    return score if board.colour == 0 else -score
+
+def evaluate_position(position, active_colour):
+    # The same score recomputed from the squares list, e.g. evaluate_position(*read_fen_position(name)[:2])
+    middlegame = 0
+    endgame = 0
+    phase = 0
+    white_pawns = 0
+    black_pawns = 0
+    for square, piece in enumerate(position):
+        if piece is not None:
+            middlegame += MIDDLEGAME_SCORES[piece][square]
+            endgame += ENDGAME_SCORES[piece][square]
+            phase += PHASE_VALUES[piece]
+            if piece == 'P':
+                white_pawns |= 1 << square
+            elif piece == 'p':
+                black_pawns |= 1 << square
+    pawn_middlegame, pawn_endgame = pawn_structure(white_pawns, black_pawns)
+    score = taper(middlegame + pawn_middlegame, endgame + pawn_endgame, phase)
+    return score if active_colour == 'w' else -score
+
+def evaluate_board(board):
+    # Full rescan of a bitboard.Board, to check the incrementally kept totals against
+    position, active_colour = board.to_position()[:2]
+    return evaluate_position(position, active_colour)
@@ -0,0 +1,168 @@
+# Magic bitboard sliding attacks for rooks and bishops
+#
+# Each slider's attacks are found with one multiply, shift and table index:
+#   table[offset[square] + ((occupied & mask[square]) * magic[square] mod 2**64) >> shift[square]]
+# Finding the magic numbers and filling the tables takes the best part of a
+# minute in Python, so the result is written to magic_tables.bin next to this
+# file and memory-mapped on later runs.
+#
+# Squares are numbered as in chess.py and bitboard.py: 0 is a8, 63 is h1.
+
+import mmap
+import os
+import random
+import struct
+import sys
+from array import array
+
+FULL = (1 << 64) - 1
+
+CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'magic_tables.bin')
+# Bump the version whenever the table layout changes so old cache files are rebuilt
+CACHE_VERSION = 1
+HEADER = struct.Struct('<8sII')
+HEADER_MAGIC = b'CHSMAGIC'
+
+ROOK_DIRECTIONS = ((0, 1), (0, -1), (1, 0), (-1, 0))
+BISHOP_DIRECTIONS = ((1, 1), (1, -1), (-1, 1), (-1, -1))
+
+def slide(square, occupied, directions):
+    # Slow reference attacks, walking each ray until a blocker
+    attacks = 0
+    for file_step, rank_step in directions:
+        file = square % 8 + file_step
+        rank = square // 8 + rank_step
+        while 0 <= file < 8 and 0 <= rank < 8:
+            attacks |= 1 << (rank * 8 + file)
+            if occupied >> (rank * 8 + file) & 1:
+                break
+            file += file_step
+            rank += rank_step
+    return attacks
+
+def relevant_mask(square, directions):
+    # Squares whose occupancy can change the attacks; the last square of each ray never can
+    mask = 0
+    for file_step, rank_step in directions:
+        file = square % 8 + file_step
+        rank = square // 8 + rank_step
+        while 0 <= file + file_step < 8 and 0 <= rank + rank_step < 8:
+            mask |= 1 << (rank * 8 + file)
+            file += file_step
+            rank += rank_step
+    return mask
+
+def subsets(mask):
+    # Every subset of mask, by the carry-rippler trick
+    subset = 0
+    while True:
+        yield subset
+        subset = (subset - mask) & mask
+        if subset == 0:
+            return
+
+def find_magic(square, directions, rng):
+    mask = relevant_mask(square, directions)
+    bits = bin(mask).count('1')
+    shift = 64 - bits
+    occupancies = list(subsets(mask))
+    attacks = [slide(square, occupied, directions) for occupied in occupancies]
+    while True:
+        # Magics with few set bits work far more often
+        magic = rng.getrandbits(64) & rng.getrandbits(64) & rng.getrandbits(64)
+        if bin((mask * magic) & 0xFF00000000000000).count('1') < 6:
+            continue
+        table = [None] * (1 << bits)
+        for occupied, attack in zip(occupancies, attacks):
+            index = ((occupied * magic) & FULL) >> shift
+            if table[index] is None:
+                table[index] = attack
+            elif table[index] != attack:
+                break
+        else:
+            return magic, [attack or 0 for attack in table]
+
+def generate_tables():
+    # Returns the rook magics, bishop magics and one flat attack table holding
+    # every square's rook entries followed by every square's bishop entries
+    rng = random.Random(20240101)
+    magics = {}
+    entries = array('Q')
+    for directions in (ROOK_DIRECTIONS, BISHOP_DIRECTIONS):
+        magics[directions] = array('Q')
+        for square in range(64):
+            magic, table = find_magic(square, directions, rng)
+            magics[directions].append(magic)
+            entries.extend(table)
+    return magics[ROOK_DIRECTIONS], magics[BISHOP_DIRECTIONS], entries
+
+def write_cache(path, rook_magics, bishop_magics, entries):
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'wb') as file:
+        file.write(HEADER.pack(HEADER_MAGIC, CACHE_VERSION, len(entries)))
+        # Store the native byte order so the file can be memory-mapped straight into an array view
+        file.write(b'L' if sys.byteorder == 'little' else b'B')
+        file.write(bytes(7))
+        rook_magics.tofile(file)
+        bishop_magics.tofile(file)
+        entries.tofile(file)
+    os.replace(temp_path, path)
+
+def read_cache(path):
+    # Memory-map the cache file, returning None if it is missing or stale
+    try:
+        with open(path, 'rb') as file:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    data_start = HEADER.size + 8
+    if len(mapped) < data_start:
+        return None
+    magic, version, count = HEADER.unpack_from(mapped)
+    byte_order = mapped[HEADER.size:HEADER.size + 1]
+    if magic != HEADER_MAGIC or version != CACHE_VERSION or byte_order != (b'L' if sys.byteorder == 'little' else b'B'):
+        return None
+    if len(mapped) != data_start + (128 + count) * 8:
+        return None
+    view = memoryview(mapped)[data_start:].cast('Q')
+    return view[:64], view[64:128], view[128:]
+
+def load_tables(path=CACHE_FILE):
+    tables = read_cache(path)
+    if tables is None or len(tables[2]) != table_size:
+        rook_magics, bishop_magics, entries = generate_tables()
+        try:
+            write_cache(path, rook_magics, bishop_magics, entries)
+        except OSError:
+            # A read-only checkout still works, it just regenerates every run
+            return rook_magics, bishop_magics, entries
+        tables = read_cache(path)
+        if tables is None:
+            return rook_magics, bishop_magics, entries
+    return tables
+
+ROOK_MASKS = tuple(relevant_mask(square, ROOK_DIRECTIONS) for square in range(64))
+BISHOP_MASKS = tuple(relevant_mask(square, BISHOP_DIRECTIONS) for square in range(64))
+ROOK_SHIFTS = tuple(64 - bin(mask).count('1') for mask in ROOK_MASKS)
+BISHOP_SHIFTS = tuple(64 - bin(mask).count('1') for mask in BISHOP_MASKS)
+
+def table_offsets(shifts, start):
+    offsets = []
+    for shift in shifts:
+        offsets.append(start)
+        start += 1 << (64 - shift)
+    return tuple(offsets), start
+
+ROOK_OFFSETS, rook_end = table_offsets(ROOK_SHIFTS, 0)
+BISHOP_OFFSETS, table_size = table_offsets(BISHOP_SHIFTS, rook_end)
+
+ROOK_MAGICS, BISHOP_MAGICS, ATTACK_TABLE = load_tables()
+# Plain tuples index faster than the mapped view for the 64 magics
+ROOK_MAGICS = tuple(ROOK_MAGICS)
+BISHOP_MAGICS = tuple(BISHOP_MAGICS)
+
+def rook_attacks(square, occupied):
+    return ATTACK_TABLE[ROOK_OFFSETS[square] + ((((occupied & ROOK_MASKS[square]) * ROOK_MAGICS[square]) & FULL) >> ROOK_SHIFTS[square])]
+
+def bishop_attacks(square, occupied):
+    return ATTACK_TABLE[BISHOP_OFFSETS[square] + ((((occupied & BISHOP_MASKS[square]) * BISHOP_MAGICS[square]) & FULL) >> BISHOP_SHIFTS[square])]
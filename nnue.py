@@ -0,0 +1,153 @@
+# Small NNUE-style neural evaluation, run on the CPU with NumPy
+#
+# The input is one feature per piece on each square (12 * 64 = 768), seen
+# from both sides: the white view uses the board as it is and the black view
+# the board flipped with the colours swapped. Each view goes through the same
+# hidden layer, and the side to move's view is put first for the output:
+#
+#   score = output_weights . [crelu(accumulator[us]), crelu(accumulator[them])] + output_bias
+#
+# The hidden layer's input sums (the accumulator) only change by a weight row
+# when a piece appears on or leaves a square, so Board adds and subtracts
+# those rows in its put_piece, remove_piece and move_piece primitives once a
+# network is attached, and evaluation never starts again from the whole board.
+#
+# Weights are quantised int16, read from NETWORK_FILE:
+#   header        '<8sII': b'CHSNNUE1', version, hidden size
+#   feature rows  768 * hidden little-endian int16, row piece index * 64 + square
+#   feature bias  hidden int16
+#   output        2 * hidden int16, then the output bias as one int32
+#
+# No trained network ships with the game; Network.random() writes one with
+# random weights for trying the plumbing out.
+#
+#   network = Network.load()
+#   network.attach(board)
+#   searcher.evaluate = network.evaluate
+
+import os
+import struct
+
+from batch_evaluation import np, require_numpy
+from bitboard import iterate_bits
+
+NETWORK_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'network.nnue')
+NETWORK_VERSION = 1
+HEADER = struct.Struct('<8sII')
+HEADER_MAGIC = b'CHSNNUE1'
+
+FEATURES = 12 * 64
+# Hidden values are clipped to 0..ACTIVATION_SCALE, output weights are in units of 1/WEIGHT_SCALE,
+# and OUTPUT_SCALE turns the network's output into centipawns
+ACTIVATION_SCALE = 255
+WEIGHT_SCALE = 64
+OUTPUT_SCALE = 400
+
+def mirror_feature(feature):
+    # The same piece and square seen from the black side: colours swapped and the board flipped
+    piece, square = divmod(feature, 64)
+    return ((piece + 6) % 12) * 64 + (square ^ 56)
+
+class Accumulator:
+    # Hidden layer input sums for one board, as a (2, hidden) int16 array of the white and black views.
+    # Board calls add, remove and move from its primitives; int16 arithmetic wraps, so undoing a
+    # change always restores exactly the values from before it.
+    def __init__(self, network, board):
+        self.network = network
+        self.values = network.refresh(board)
+
+    def add(self, index, square):
+        self.values += self.network.feature_rows[index * 64 + square]
+
+    def remove(self, index, square):
+        self.values -= self.network.feature_rows[index * 64 + square]
+
+    def move(self, index, from_square, to_square):
+        rows = self.network.feature_rows
+        self.values += rows[index * 64 + to_square]
+        self.values -= rows[index * 64 + from_square]
+
+class Network:
+    def __init__(self, feature_weights, feature_bias, output_weights, output_bias):
+        require_numpy('the neural evaluation')
+        self.hidden = len(feature_bias)
+        self.feature_weights = np.asarray(feature_weights, dtype=np.int16).reshape(FEATURES, self.hidden)
+        self.feature_bias = np.asarray(feature_bias, dtype=np.int16)
+        self.output_weights = np.asarray(output_weights, dtype=np.int16).reshape(2, self.hidden)
+        self.output_bias = int(output_bias)
+        # Both views' rows for each feature side by side, so one add updates the whole accumulator
+        mirrored = [mirror_feature(feature) for feature in range(FEATURES)]
+        self.feature_rows = np.stack((self.feature_weights, self.feature_weights[mirrored]), axis=1)
+        # Output weights in the order of the flattened accumulator, [white view, black view], for each side to move
+        self.output_rows = (
+            np.concatenate((self.output_weights[0], self.output_weights[1])).astype(np.int32),
+            np.concatenate((self.output_weights[1], self.output_weights[0])).astype(np.int32)
+        )
+
+    @classmethod
+    def load(cls, path=NETWORK_FILE):
+        require_numpy('the neural evaluation')
+        with open(path, 'rb') as file:
+            data = file.read()
+        if len(data) < HEADER.size:
+            raise ValueError(f"{path} is not a network file")
+        magic, version, hidden = HEADER.unpack_from(data)
+        if magic != HEADER_MAGIC or version != NETWORK_VERSION:
+            raise ValueError(f"{path} is not a version {NETWORK_VERSION} network file")
+        if len(data) != HEADER.size + (FEATURES + 3) * hidden * 2 + 4:
+            raise ValueError(f"{path} is the wrong size for a hidden layer of {hidden}")
+        values = np.frombuffer(data, dtype='<i2', count=(FEATURES + 3) * hidden, offset=HEADER.size)
+        output_bias = np.frombuffer(data, dtype='<i4', count=1, offset=HEADER.size + (FEATURES + 3) * hidden * 2)[0]
+        feature_weights = values[:FEATURES * hidden]
+        feature_bias = values[FEATURES * hidden:(FEATURES + 1) * hidden]
+        output_weights = values[(FEATURES + 1) * hidden:]
+        return cls(feature_weights, feature_bias, output_weights, output_bias)
+
+    def save(self, path=NETWORK_FILE):
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        with open(temp_path, 'wb') as file:
+            file.write(HEADER.pack(HEADER_MAGIC, NETWORK_VERSION, self.hidden))
+            for values in (self.feature_weights, self.feature_bias, self.output_weights):
+                file.write(values.astype('<i2').tobytes())
+            file.write(struct.pack('<i', self.output_bias))
+        os.replace(temp_path, path)
+
+    @classmethod
+    def random(cls, hidden=64, seed=0):
+        # An untrained network, small enough weights that the accumulator can't overflow
+        require_numpy('the neural evaluation')
+        generator = np.random.default_rng(seed)
+        feature_weights = generator.integers(-16, 17, size=(FEATURES, hidden))
+        feature_bias = generator.integers(0, 64, size=hidden)
+        output_weights = generator.integers(-32, 33, size=2 * hidden)
+        return cls(feature_weights, feature_bias, output_weights, 0)
+
+    def refresh(self, board):
+        # Accumulator values worked out from every piece on the board
+        features = [index * 64 + square for index, bb in enumerate(board.pieces) for square in iterate_bits(bb)]
+        values = np.empty((2, self.hidden), dtype=np.int16)
+        values[:] = self.feature_bias
+        values += self.feature_rows[features].sum(axis=0, dtype=np.int16)
+        return values
+
+    def attach(self, board):
+        # Start keeping an accumulator up to date on board as moves are made and unmade
+        board.accumulator = Accumulator(self, board)
+        return board.accumulator
+
+    def output(self, values, colour):
+        clipped = np.clip(values.ravel(), 0, ACTIVATION_SCALE).astype(np.int32)
+        total = int(clipped @ self.output_rows[colour]) + self.output_bias
+        return total * OUTPUT_SCALE // (ACTIVATION_SCALE * WEIGHT_SCALE)
+
+    def evaluate(self, board, pawn_table=None):
+        # Score from the side to move's point of view, from the board's accumulator.
+        # Takes pawn_table only so it can stand in for evaluation.evaluate in the search.
+        accumulator = board.accumulator
+        if accumulator is None or accumulator.network is not self:
+            accumulator = self.attach(board)
+        return self.output(accumulator.values, board.colour)
+
+    def evaluate_from_scratch(self, board):
+        # The same score with the accumulator rebuilt from the whole board, for checking
+        return self.output(self.refresh(board), board.colour)
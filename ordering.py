@@ -0,0 +1,115 @@
+# Move ordering for the alpha-beta search
+#
+# Alpha-beta cuts off soonest when the best move is tried first, so moves are
+# ranked before searching:
+#   1. the hash move from the transposition table
+#   2. captures and promotions, most valuable victim first, then least valuable attacker
+#   3. the two killer moves at this ply, quiet moves that caused a cutoff in a sibling
+#   4. the remaining quiet moves by history score, how often they caused cutoffs anywhere
+#
+# staged_moves hands the moves out in that order one stage at a time, so a
+# node that cuts off on the hash move or a capture never generates its quiets.
+
+from bitboard import PIECES, PIECE_INDEX
+
+# Victim values in ordering units; the attacker only breaks ties between equal victims
+ORDER_VALUES = (1, 3, 3, 5, 9, 100)
+MAX_PLY = 128
+
+HASH_MOVE_SCORE = 1 << 30
+CAPTURE_SCORE = 1 << 28
+KILLER_SCORES = (1 << 27, (1 << 27) - 1)
+# History scores are halved when one gets this big, so they never reach the killers
+HISTORY_LIMIT = 1 << 20
+
+def build_mvv_lva():
+    # MVV_LVA[victim][attacker], indexed by piece character
+    table = {}
+    for victim in PIECES:
+        table[victim] = {}
+        for attacker in PIECES:
+            table[victim][attacker] = ORDER_VALUES[PIECE_INDEX[victim] % 6] * 16 - ORDER_VALUES[PIECE_INDEX[attacker] % 6]
+    return table
+
+MVV_LVA = build_mvv_lva()
+
+class MoveOrderer:
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.killers = [[0, 0] for ply in range(MAX_PLY)]
+        # Indexed by piece index * 64 + destination square
+        self.history = [0] * (12 * 64)
+
+    def new_search(self):
+        # Killers belong to the old tree, but history is still a good guide; just age it
+        self.killers = [[0, 0] for ply in range(MAX_PLY)]
+        self.history = [score >> 2 for score in self.history]
+
+    def order(self, board, moves, hash_move=0, ply=0):
+        # Sort moves in place, best first
+        squares = board.squares
+        en_passant = board.en_passant
+        history = self.history
+        if ply < MAX_PLY:
+            killer_1, killer_2 = self.killers[ply]
+        else:
+            killer_1 = killer_2 = -1
+        scores = {}
+        for move in moves:
+            to_square = (move >> 6) & 63
+            piece = squares[move & 63]
+            victim = squares[to_square]
+            if move == hash_move:
+                score = HASH_MOVE_SCORE
+            elif victim is not None:
+                score = CAPTURE_SCORE + MVV_LVA[victim][piece] + (move >> 12)
+            elif move >> 12:
+                # A promotion wins the promoted piece's value like a capture would
+                score = CAPTURE_SCORE + ORDER_VALUES[move >> 12] * 16
+            elif to_square == en_passant and (piece == 'P' or piece == 'p'):
+                score = CAPTURE_SCORE + MVV_LVA['p']['p']
+            elif move == killer_1:
+                score = KILLER_SCORES[0]
+            elif move == killer_2:
+                score = KILLER_SCORES[1]
+            else:
+                score = history[PIECE_INDEX[piece] * 64 + to_square]
+            scores[move] = score
+        moves.sort(key=scores.__getitem__, reverse=True)
+        return moves
+
+    def is_quiet(self, board, move):
+        return board.squares[(move >> 6) & 63] is None and not move >> 12 and not (
+            (move >> 6) & 63 == board.en_passant and board.squares[move & 63] in ('P', 'p'))
+
+    def record_cutoff(self, board, move, depth, ply):
+        # Remember a quiet move that caused a beta cutoff. Called with the move still unmade.
+        if not self.is_quiet(board, move):
+            return
+        if ply < MAX_PLY:
+            killers = self.killers[ply]
+            if killers[0] != move:
+                killers[1] = killers[0]
+                killers[0] = move
+        index = PIECE_INDEX[board.squares[move & 63]] * 64 + ((move >> 6) & 63)
+        self.history[index] += depth * depth
+        if self.history[index] >= HISTORY_LIMIT:
+            self.history = [score >> 1 for score in self.history]
+
+    def staged_moves(self, board, hash_move=0, ply=0):
+        # Yield the legal moves best first, generating each stage only when it is reached.
+        # Checkers and pins are all the hash move needs unless it is a king move, so the
+        # squares the king may not step onto are only worked out once generation starts.
+        context = board.legal_context(danger=False)
+        if hash_move and board.is_legal(hash_move, context):
+            yield hash_move
+        else:
+            hash_move = 0
+        context = (board.king_danger(),) + context[1:]
+        for captures, quiets in ((True, False), (False, True)):
+            moves = board.legal_moves(captures, quiets, context)
+            for move in self.order(board, moves, 0, ply):
+                if move != hash_move:
+                    yield move
@@ -0,0 +1,203 @@
+# Lazy SMP: the same search run in several processes sharing one transposition table
+#
+# Threads can't search in parallel under the GIL, so each worker is a process
+# running an ordinary Searcher on the same root position. The workers don't
+# divide the tree between them; they only share the transposition table,
+# which lives in a multiprocessing.shared_memory block (see the note on
+# lockless entries in transposition.py). Results one worker stores cut short
+# the others' searches, and helpers start from a slightly shuffled move
+# order so they don't all walk the tree in step.
+#
+# Worker 0 decides when the search is over. Every worker reports each depth
+# it completes, and the deepest completed result is the answer.
+#
+#   with ParallelSearch(processes=8, hash_mb=256) as parallel:
+#       best_move, score = parallel.search(board, movetime=5.0)
+#
+# stop() and set_time_limit() can be called from another thread, as with a
+# Searcher. One that comes before search() has started isn't lost; a caller
+# that can't be sure the last search was still running when it stopped it
+# calls reset_limits() before the next.
+
+import multiprocessing
+import os
+import queue
+import random
+import threading
+import time
+from multiprocessing import shared_memory
+
+from bitboard import Board
+from search import Searcher
+from transposition import TranspositionTable, table_bytes
+
+# Workers are forked from a server process rather than from the caller where that's possible.
+# The caller may have other threads (uci.py reads stdin in one), and a fork copies any lock
+# they hold, such as stdin's, already taken, with no thread left in the child to let it go.
+START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else None
+
+# History scores given to helpers at random, enough to reorder quiet moves without drowning out real cutoffs
+HELPER_HISTORY_NOISE = 1024
+
+def search_worker(worker, memory_name, hash_mb, age, fen, moves, depth, movetime, nodes, stop_event, results):
+    # Runs in each worker process. Reports ('iteration', worker, depth, score, move, nodes)
+    # after every completed depth and ('done', worker, nodes, move, score) at the end.
+    memory = shared_memory.SharedMemory(name=memory_name)
+    tt = TranspositionTable(hash_mb, buffer=memory.buf)
+    try:
+        tt.age = age
+        board = Board.from_fen(fen)
+        for move in moves:
+            board.make_move(move)
+        # The searcher checks the shared stop event itself along with its clock. It is never
+        # waited on: setting it would block until every process waiting on it had woken,
+        # and one that has already exited never will.
+        searcher = Searcher(board, tt=tt, stop_event=stop_event)
+        if worker > 0:
+            noise = random.Random(worker)
+            searcher.orderer.history = [noise.randrange(HELPER_HISTORY_NOISE) for score in searcher.orderer.history]
+
+        def report(current, score, best_move, searcher):
+            results.put(('iteration', worker, current, score, best_move, searcher.nodes))
+
+        best_move, score = searcher.search(depth, movetime, nodes, on_iteration=report)
+        results.put(('done', worker, searcher.nodes, best_move, score))
+    finally:
+        # The block can't be closed while the table still has a view of it
+        tt.table.release()
+        memory.close()
+
+class ParallelSearch:
+    def __init__(self, processes=None, hash_mb=16):
+        self.processes = processes or os.cpu_count() or 1
+        self.hash_mb = hash_mb
+        self.memory = shared_memory.SharedMemory(create=True, size=table_bytes(hash_mb))
+        self.tt = TranspositionTable(hash_mb, buffer=self.memory.buf)
+        self.context = multiprocessing.get_context(START_METHOD)
+        if START_METHOD == 'forkserver':
+            # Start the server now rather than on the first search's clock
+            from multiprocessing import forkserver
+            forkserver.ensure_running()
+        self.stop_event = self.context.Event()
+        self.nodes = 0
+        self.completed_depth = 0
+        # Guards the time limit between search() and the thread calling set_time_limit()
+        self.lock = threading.Lock()
+        self.searching = False
+        # (movetime, when it was given) from set_time_limit, and the timer stopping the search when it runs out
+        self.time_limit = None
+        self.timer = None
+
+    def stop(self):
+        self.stop_event.set()
+
+    def set_time_limit(self, movetime):
+        # As Searcher.set_time_limit: the search stops movetime seconds from now
+        with self.lock:
+            self.time_limit = (movetime, time.perf_counter())
+            if self.searching:
+                self.start_timer()
+
+    def start_timer(self):
+        # Called with the lock held
+        movetime, given = self.time_limit
+        if self.timer is not None:
+            self.timer.cancel()
+        self.timer = threading.Timer(max(0.0, given + movetime - time.perf_counter()), self.stop)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def reset_limits(self):
+        # Forget a stop() or set_time_limit() that came after the last search had ended
+        with self.lock:
+            self.stop_event.clear()
+            self.time_limit = None
+
+    def search(self, board, depth=None, movetime=None, nodes=None, on_iteration=None):
+        # Same limits as Searcher.search, with nodes shared out between the workers.
+        # on_iteration(depth, score, best_move) is called each time a deeper result comes in.
+        # Returns (best_move, score) and leaves board as it was.
+        fen, history = board.history()
+
+        # Each worker's Searcher.search moves its copy of the age on by one, to match this one
+        age = self.tt.age
+        self.tt.new_search()
+        self.nodes = 0
+        with self.lock:
+            self.searching = True
+            # The workers only start their clocks once they are running, so the whole search is timed here too
+            if self.time_limit is None and movetime is not None:
+                self.time_limit = (movetime, time.perf_counter())
+            if self.time_limit is not None:
+                self.start_timer()
+        worker_nodes = None if nodes is None else max(1, nodes // self.processes)
+        results = self.context.Queue()
+        workers = []
+        for worker in range(self.processes):
+            process = self.context.Process(target=search_worker, args=(
+                worker, self.memory.name, self.hash_mb, age, fen, history, depth, movetime, worker_nodes, self.stop_event, results))
+            process.start()
+            workers.append(process)
+
+        best = None
+        final = (0, 0)
+        node_counts = [0] * self.processes
+        running = self.processes
+        try:
+            while running:
+                try:
+                    message = results.get(timeout=0.1)
+                except queue.Empty:
+                    if not any(process.is_alive() for process in workers):
+                        break
+                    continue
+                if message[0] == 'iteration':
+                    kind, worker, current, score, best_move, worker_nodes_so_far = message
+                    node_counts[worker] = worker_nodes_so_far
+                    self.nodes = sum(node_counts)
+                    # Deepest result wins, and worker 0's on a tie since it searched with the normal ordering
+                    if best is None or current > best[0] or (current == best[0] and worker == 0):
+                        best = (current, score, best_move)
+                        if on_iteration is not None:
+                            on_iteration(current, score, best_move)
+                else:
+                    kind, worker, worker_nodes_so_far, best_move, score = message
+                    node_counts[worker] = worker_nodes_so_far
+                    running -= 1
+                    if worker == 0:
+                        final = (best_move, score)
+                        # The main search has finished, so the helpers can stop too
+                        self.stop_event.set()
+        finally:
+            with self.lock:
+                self.searching = False
+                self.time_limit = None
+                timer = self.timer
+                self.timer = None
+            if timer is not None:
+                timer.cancel()
+                timer.join()
+            self.stop_event.set()
+            for process in workers:
+                process.join()
+            # Ready for the next search
+            self.stop_event.clear()
+
+        self.nodes = sum(node_counts)
+        if best is None:
+            # No depth was completed: there are no legal moves, or every worker failed
+            return final
+        self.completed_depth = best[0]
+        return best[2], best[1]
+
+    def close(self):
+        self.tt.table.release()
+        self.tt = None
+        self.memory.close()
+        self.memory.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,141 @@
+# Pawn structure evaluation and the pawn hash table that caches it
+#
+# Scores doubled, isolated, backward and passed pawns from the two pawn
+# bitboards alone. The pawns move far less often than the pieces, so the
+# same structure turns up at node after node of a search; PawnHashTable keeps
+# the result keyed on a Zobrist key of the pawns only (Board.pawn_hash in
+# bitboard.py) so it is usually worked out once per structure.
+#
+# Scores are (middlegame, endgame) pairs from white's point of view, to be
+# blended by phase along with the rest of evaluation.py.
+
+from array import array
+
+# Squares are numbered like bitboard.py: a8 = 0 to h1 = 63, so white pawns move towards 0.
+# This module can't import bitboard.py, which imports it through evaluation.py.
+FULL = (1 << 64) - 1
+FILES = tuple(sum(1 << (rank * 8 + file) for rank in range(8)) for file in range(8))
+NOT_FILE_A = FULL ^ FILES[0]
+NOT_FILE_H = FULL ^ FILES[7]
+
+DOUBLED = (-10, -20)
+ISOLATED = (-10, -15)
+BACKWARD = (-8, -10)
+# Passed pawn bonus by rank counted from the pawn's own side, so index 6 is one step from promoting
+PASSED = ((0, 0), (5, 10), (10, 20), (20, 35), (35, 60), (60, 100), (100, 150), (0, 0))
+
+def build_adjacent_files():
+    adjacent = []
+    for file in range(8):
+        mask = 0
+        if file > 0:
+            mask |= FILES[file - 1]
+        if file < 7:
+            mask |= FILES[file + 1]
+        adjacent.append(mask)
+    return tuple(adjacent)
+
+ADJACENT_FILES = build_adjacent_files()
+
+def build_pawn_masks():
+    # For each colour and square:
+    #   passed  - squares ahead on the same and adjacent files that an enemy pawn would block or guard
+    #   support - squares beside and behind on the adjacent files, where a friendly pawn could defend it
+    passed = ([0] * 64, [0] * 64)
+    support = ([0] * 64, [0] * 64)
+    for square in range(64):
+        row = square >> 3
+        file = square & 7
+        files = FILES[file] | ADJACENT_FILES[file]
+        ahead_white = (1 << (row * 8)) - 1
+        ahead_black = FULL ^ ((1 << (row * 8 + 8)) - 1)
+        passed[0][square] = files & ahead_white
+        passed[1][square] = files & ahead_black
+        support[0][square] = ADJACENT_FILES[file] & ~ahead_white & FULL
+        support[1][square] = ADJACENT_FILES[file] & ~ahead_black & FULL
+    return tuple(tuple(masks) for masks in passed), tuple(tuple(masks) for masks in support)
+
+PASSED_MASKS, SUPPORT_MASKS = build_pawn_masks()
+
+def iterate_squares(bb):
+    while bb:
+        low = bb & -bb
+        yield low.bit_length() - 1
+        bb ^= low
+
+def side_structure(pawns, enemy_pawns, enemy_attacks, colour):
+    # (middlegame, endgame) score of one side's pawns
+    middlegame = 0
+    endgame = 0
+    for file in range(8):
+        count = (pawns & FILES[file]).bit_count()
+        if count > 1:
+            middlegame += DOUBLED[0] * (count - 1)
+            endgame += DOUBLED[1] * (count - 1)
+    passed_masks = PASSED_MASKS[colour]
+    support_masks = SUPPORT_MASKS[colour]
+    for square in iterate_squares(pawns):
+        file = square & 7
+        if not pawns & ADJACENT_FILES[file]:
+            middlegame += ISOLATED[0]
+            endgame += ISOLATED[1]
+        elif not pawns & support_masks[square]:
+            # Nothing can come up to defend it, and it can't advance without being taken
+            stop_square = square - 8 if colour == 0 else square + 8
+            if enemy_attacks >> stop_square & 1:
+                middlegame += BACKWARD[0]
+                endgame += BACKWARD[1]
+        if not enemy_pawns & passed_masks[square]:
+            rank = 7 - (square >> 3) if colour == 0 else square >> 3
+            middlegame += PASSED[rank][0]
+            endgame += PASSED[rank][1]
+    return middlegame, endgame
+
+def pawn_structure(white_pawns, black_pawns):
+    # (middlegame, endgame) score of both sides' pawns, from white's point of view
+    white_attacks = ((white_pawns & NOT_FILE_A) >> 9) | ((white_pawns & NOT_FILE_H) >> 7)
+    black_attacks = (((black_pawns & NOT_FILE_A) << 7) | ((black_pawns & NOT_FILE_H) << 9)) & FULL
+    white_middlegame, white_endgame = side_structure(white_pawns, black_pawns, black_attacks, 0)
+    black_middlegame, black_endgame = side_structure(black_pawns, white_pawns, white_attacks, 1)
+    return white_middlegame - black_middlegame, white_endgame - black_endgame
+
+class PawnHashTable:
+    # Laid out like TranspositionTable: two unsigned 64-bit ints an entry, the
+    # pawn key and then both scores packed as score + 32768 in 16 bits each.
+    # A new structure always replaces whatever shares its slot.
+    def __init__(self, entries=16384):
+        self.size = 1 << (max(1, entries).bit_length() - 1)
+        self.mask = self.size - 1
+        self.table = array('Q', bytes(self.size * 16))
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        self.table = array('Q', bytes(self.size * 16))
+
+    def probe(self, key, white_pawns, black_pawns):
+        # Cached pawn_structure(white_pawns, black_pawns) for the structure with this key
+        index = (key & self.mask) << 1
+        table = self.table
+        data = table[index + 1]
+        if data and table[index] == key:
+            self.hits += 1
+            return (data & 0xFFFF) - 32768, (data >> 16) - 32768
+        self.misses += 1
+        middlegame, endgame = pawn_structure(white_pawns, black_pawns)
+        table[index] = key
+        table[index + 1] = (middlegame + 32768) | ((endgame + 32768) << 16)
+        return middlegame, endgame
+
+    def stats(self):
+        probes = self.hits + self.misses
+        return {
+            'entries': self.size,
+            'probes': probes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / probes if probes else 0.0
+        }
@@ -0,0 +1,180 @@
+# Perft: count the leaf nodes of the legal move tree to check and time move generation
+#
+# Usage:
+#   python perft.py                       every FEN file in Positions/, depths 1 to 4
+#   python perft.py GM_position.txt -d 5  one file, depths 1 to 5
+#   python perft.py --divide              also print the count below each root move
+#   python perft.py --reference           the standard test positions, checked against known counts
+#   python perft.py -j 8 -d 6             split the tree across 8 worker processes
+#
+# Results are compared with REFERENCE_COUNTS whenever the position is one of
+# the known ones, and the exit status is non-zero if any count is wrong.
+
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+from bitboard import Board, move_name
+
+POSITIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Positions')
+
+# Published perft results, keyed by the first four FEN fields
+REFERENCE_POSITIONS = {
+    'start': 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1',
+    'kiwipete': 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+    'position3': '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1',
+    'position4': 'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1',
+    'position5': 'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8',
+    'position6': 'r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10'
+}
+REFERENCE_COUNTS = {
+    'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq -': (20, 400, 8902, 197281, 4865609, 119060324),
+    'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq -': (48, 2039, 97862, 4085603, 193690690),
+    '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - -': (14, 191, 2812, 43238, 674624, 11030083),
+    'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq -': (6, 264, 9467, 422333, 15833292),
+    'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ -': (44, 1486, 62379, 2103487, 89941194),
+    'r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - -': (46, 2079, 89890, 3894594, 164075551)
+}
+
+def read_fen_file(fen_filepath):
+    # Same lookup as read_fen_position in core.py, but straight into a Board
+    with open(os.path.join(POSITIONS_DIR, fen_filepath), 'r') as file:
+        return Board.from_fen(file.read())
+
+def reference_counts(board):
+    return REFERENCE_COUNTS.get(' '.join(board.fen().split()[:4]))
+
+def perft(board, depth):
+    if depth == 0:
+        return 1
+    moves = board.legal_moves()
+    # The last ply only needs counting, not playing
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        board.make_move(move)
+        nodes += perft(board, depth - 1)
+        board.unmake_move()
+    return nodes
+
+def divide(board, depth):
+    # Node counts below each root move
+    counts = {}
+    for move in board.legal_moves():
+        board.make_move(move)
+        counts[move] = perft(board, depth - 1)
+        board.unmake_move()
+    return counts
+
+def perft_task(task):
+    # Runs in a worker: rebuild the position from the root FEN and the moves leading to it
+    fen, path, depth = task
+    board = Board.from_fen(fen)
+    for move in path:
+        board.make_move(move)
+    return path, perft(board, depth)
+
+def parallel_divide(board, depth, pool, processes):
+    # Same result as divide(), with the subtrees counted across a process pool.
+    # Workers only receive the root FEN plus a few packed move ints each.
+    fen = board.fen()
+    root_moves = board.legal_moves()
+    tasks = []
+    if len(root_moves) >= processes * 4 or depth < 3:
+        for move in root_moves:
+            tasks.append((fen, (move,), depth - 1))
+    else:
+        # Too few root moves to keep every core busy, so split one ply deeper
+        for move in root_moves:
+            board.make_move(move)
+            for reply in board.legal_moves():
+                tasks.append((fen, (move, reply), depth - 2))
+            board.unmake_move()
+    counts = dict.fromkeys(root_moves, 0)
+    for path, nodes in pool.imap_unordered(perft_task, tasks):
+        counts[path[0]] += nodes
+    return counts
+
+def run(name, board, depth, show_divide=False, pool=None, processes=1):
+    # Print nodes and speed for every depth up to depth.
+    # Returns whether every known count matched, and the total nodes and time.
+    expected = reference_counts(board)
+    ok = True
+    total_nodes = 0
+    total_time = 0
+    print(f"{name}: {board.fen()}")
+    for current in range(1, depth + 1):
+        start = time.perf_counter()
+        if pool is not None and current >= 3:
+            counts = parallel_divide(board, current, pool, processes)
+            nodes = sum(counts.values())
+        elif show_divide and current == depth:
+            counts = divide(board, current)
+            nodes = sum(counts.values())
+        else:
+            nodes = perft(board, current)
+        elapsed = time.perf_counter() - start
+        total_nodes += nodes
+        total_time += elapsed
+        nps = nodes / elapsed if elapsed > 0 else 0
+        status = ''
+        if expected is not None and current <= len(expected):
+            if nodes == expected[current - 1]:
+                status = '  ok'
+            else:
+                status = f'  WRONG, expected {expected[current - 1]}'
+                ok = False
+        print(f"  depth {current}: {nodes} nodes in {elapsed:.3f}s ({nps:,.0f} nodes/s){status}")
+    if show_divide:
+        for move in sorted(counts, key=move_name):
+            print(f"    {move_name(move)}: {counts[move]}")
+    return ok, total_nodes, total_time
+
+def positive_int(text):
+    value = int(text)
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, not {value}")
+    return value
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Count legal move tree leaves to check and benchmark move generation.')
+    parser.add_argument('files', nargs='*', help='FEN files in Positions/ (default: all of them)')
+    parser.add_argument('-d', '--depth', type=positive_int, default=4, help='deepest depth to count (default: 4)')
+    parser.add_argument('--divide', action='store_true', help='print the count below each root move at the deepest depth')
+    parser.add_argument('--reference', action='store_true', help='run the standard test positions instead of Positions/')
+    parser.add_argument('-j', '--processes', type=int, default=1, help='worker processes to split the tree across (default: 1)')
+    args = parser.parse_args(argv)
+
+    if args.reference:
+        boards = [(name, Board.from_fen(fen)) for name, fen in REFERENCE_POSITIONS.items()]
+    else:
+        files = args.files or sorted(os.listdir(POSITIONS_DIR))
+        boards = [(fen_filepath, read_fen_file(fen_filepath)) for fen_filepath in files]
+
+    ok = True
+    total_nodes = 0
+    total_time = 0
+    pool = None
+    if args.processes > 1:
+        pool = multiprocessing.Pool(args.processes)
+    try:
+        for name, board in boards:
+            board_ok, nodes, elapsed = run(name, board, args.depth, args.divide, pool, args.processes)
+            ok = ok and board_ok
+            total_nodes += nodes
+            total_time += elapsed
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    nps = total_nodes / total_time if total_time > 0 else 0
+    print(f"Total: {total_nodes} nodes in {total_time:.3f}s ({nps:,.0f} nodes/s)")
+    if not ok:
+        print("Some counts did not match the reference")
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
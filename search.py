@@ -0,0 +1,298 @@
+# Alpha-beta search for picking a move
+#
+# Negamax alpha-beta with iterative deepening, a quiescence search over
+# captures at the leaves, the transposition table from transposition.py,
+# the move ordering from ordering.py and the evaluation from evaluation.py.
+# Scores are in centipawns from the point of view of the side to move.
+#
+#   best_move, score = search_position(*read_fen_position('GM_position.txt'), movetime=2.0)
+#   move_name(best_move)  # e.g. 'c8b7'
+
+import time
+
+from bitboard import Board
+from evaluation import evaluate
+from ordering import MoveOrderer
+from pawns import PawnHashTable
+from transposition import TranspositionTable, EXACT, LOWER, UPPER
+
+INFINITY = 32000
+MATE_SCORE = 30000
+# Scores beyond this are mates, and are stored in the table relative to the node
+MATE_BOUND = MATE_SCORE - 1000
+MAX_DEPTH = 64
+
+# Quiescence plies in which a side in check searches all its evasions. Deeper than this it stands
+# pat like any other side, or capture-check-evade chains can run on for dozens of plies.
+QUIESCENCE_EVASION_PLIES = 1
+
+# How many nodes to search between checks of the clock and the stop flag. At a few tens of
+# thousands of nodes a second this keeps a search within about 10 ms of its deadline.
+CHECK_INTERVAL = 256
+
+class SearchStopped(Exception):
+    # Raised from deep inside the tree to unwind it once the budget is used up
+    pass
+
+class Searcher:
+    def __init__(self, board, tt=None, hash_mb=16, stop_event=None):
+        # stop_event is anything with an is_set() method, e.g. a multiprocessing.Event shared
+        # between processes; the search stops as soon as it is set, as it does after stop()
+        self.board = board
+        self.tt = tt if tt is not None else TranspositionTable(hash_mb)
+        self.orderer = MoveOrderer()
+        self.pawn_table = PawnHashTable()
+        self.evaluate = evaluate
+        self.stop_event = stop_event
+        # Only cleared here, so a stop() that comes before search() has started isn't lost
+        self.stopped = False
+        self.reset_limits()
+
+    def reset_limits(self, movetime=None, nodes=None):
+        self.nodes = 0
+        self.start_time = time.perf_counter()
+        # When the clock started, which is later than start_time if set_time_limit gave a running search its time
+        self.limit_start = self.start_time
+        self.deadline = None if movetime is None else self.start_time + movetime
+        self.node_limit = nodes
+        self.next_check = CHECK_INTERVAL
+        # Nodes searched by each completed iteration, and how often the first move tried caused the cutoff
+        self.iteration_nodes = []
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+
+    def stop(self):
+        # Can be called from another thread; the search notices at its next check
+        self.stopped = True
+
+    def set_time_limit(self, movetime):
+        # Give a running search movetime seconds from now, e.g. when pondering turns into the real search.
+        # Like stop() this can be called from another thread.
+        self.limit_start = time.perf_counter()
+        self.deadline = self.limit_start + movetime
+
+    def check_limits(self):
+        self.next_check = self.nodes + CHECK_INTERVAL
+        if self.stopped or (self.stop_event is not None and self.stop_event.is_set()):
+            raise SearchStopped
+        if self.deadline is not None and time.perf_counter() >= self.deadline:
+            raise SearchStopped
+        if self.node_limit is not None and self.nodes >= self.node_limit:
+            raise SearchStopped
+
+    def is_draw(self):
+        # Fifty-move rule, or a repetition since the last capture or pawn move
+        board = self.board
+        if board.halfmove >= 100:
+            return True
+        history = board.undo_stack
+        key = board.hash
+        # Only positions with the same side to move can repeat, so step back two plies at a time
+        for back in range(2, min(board.halfmove, len(history)) + 1, 2):
+            if history[-back][5] == key:
+                return True
+        return False
+
+    def quiescence(self, alpha, beta, ply, quiescence_ply=0):
+        # Only play captures and promotions until the position is quiet, so the
+        # evaluation is never taken halfway through an exchange
+        self.nodes += 1
+        if self.nodes >= self.next_check:
+            self.check_limits()
+        board = self.board
+
+        if quiescence_ply < QUIESCENCE_EVASION_PLIES and board.in_check():
+            # No standing pat while in check, every evasion has to be looked at
+            moves = board.legal_moves()
+            if not moves:
+                return -MATE_SCORE + ply
+            best = -INFINITY
+        else:
+            best = self.evaluate(board, self.pawn_table)
+            if best >= beta:
+                return best
+            if best > alpha:
+                alpha = best
+            moves = board.legal_moves(captures=True, quiets=False)
+
+        for move in self.orderer.order(board, moves, 0, ply):
+            board.make_move(move)
+            score = -self.quiescence(-beta, -alpha, ply + 1, quiescence_ply + 1)
+            board.unmake_move()
+            if score > best:
+                best = score
+                if score > alpha:
+                    alpha = score
+                    if score >= beta:
+                        break
+        return best
+
+    def negamax(self, depth, alpha, beta, ply):
+        if depth <= 0:
+            return self.quiescence(alpha, beta, ply)
+        self.nodes += 1
+        if self.nodes >= self.next_check:
+            self.check_limits()
+        board = self.board
+        if ply > 0 and self.is_draw():
+            return 0
+
+        original_alpha = alpha
+        key = board.hash
+        hash_move = 0
+        entry = self.tt.probe(key)
+        if entry is not None:
+            entry_depth, entry_score, bound, hash_move = entry
+            if entry_depth >= depth and ply > 0:
+                entry_score = score_from_tt(entry_score, ply)
+                if bound == EXACT:
+                    return entry_score
+                if bound == LOWER and entry_score >= beta:
+                    return entry_score
+                if bound == UPPER and entry_score <= alpha:
+                    return entry_score
+
+        best = -INFINITY
+        best_move = 0
+        for index, move in enumerate(self.orderer.staged_moves(board, hash_move, ply)):
+            board.make_move(move)
+            score = -self.negamax(depth - 1, -beta, -alpha, ply + 1)
+            board.unmake_move()
+            if score > best:
+                best = score
+                best_move = move
+                if ply == 0:
+                    # Kept outside the table so an iteration cut short still has its best move so far
+                    self.root_best = (move, score)
+                if score > alpha:
+                    alpha = score
+                    if score >= beta:
+                        self.cutoffs += 1
+                        if index == 0:
+                            self.first_move_cutoffs += 1
+                        self.orderer.record_cutoff(board, move, depth, ply)
+                        break
+
+        if not best_move:
+            # No legal moves: checkmate or stalemate
+            return -MATE_SCORE + ply if board.in_check() else 0
+
+        if best >= beta:
+            bound = LOWER
+        elif best > original_alpha:
+            bound = EXACT
+        else:
+            bound = UPPER
+        self.tt.store(key, depth, score_to_tt(best, ply), bound, best_move)
+        return best
+
+    def principal_variation(self, max_length=MAX_DEPTH):
+        return principal_variation(self.board, self.tt, max_length)
+
+    def search(self, depth=None, movetime=None, nodes=None, on_iteration=None):
+        # Iterative deepening up to depth, stopping when movetime (seconds) or
+        # nodes runs out. on_iteration(depth, score, best_move, searcher) is
+        # called after every completed depth. Returns (best_move, score).
+        max_depth = depth if depth is not None else MAX_DEPTH
+        self.reset_limits(movetime, nodes)
+        self.tt.new_search()
+        self.orderer.new_search()
+        self.completed_depth = 0
+        root_length = len(self.board.undo_stack)
+        best_move = 0
+        best_score = 0
+
+        root_moves = self.board.legal_moves()
+        if not root_moves:
+            return 0, (-MATE_SCORE if self.board.in_check() else 0)
+
+        for current in range(1, max_depth + 1):
+            self.root_best = None
+            try:
+                score = self.negamax(current, -INFINITY, INFINITY, 0)
+            except SearchStopped:
+                # Unwind the moves still made on the board by the interrupted iteration
+                while len(self.board.undo_stack) > root_length:
+                    self.board.unmake_move()
+                if self.completed_depth == 0:
+                    # Out of time before depth 1 finished: take the best root move searched so far,
+                    # or failing that the first move in the usual order
+                    if self.root_best is not None:
+                        best_move, best_score = self.root_best
+                    else:
+                        entry = self.tt.probe(self.board.hash)
+                        hash_move = entry[3] if entry is not None else 0
+                        best_move = self.orderer.order(self.board, list(root_moves), hash_move, 0)[0]
+                        best_score = self.evaluate(self.board, self.pawn_table)
+                break
+            # Not read back from the table, where another process sharing it may have just stored
+            # its own result for the root (see parallel.py)
+            best_move = self.root_best[0]
+            best_score = score
+            self.completed_depth = current
+            self.iteration_nodes.append(self.nodes)
+            if on_iteration is not None:
+                on_iteration(current, score, best_move, self)
+            if abs(score) > MATE_BOUND:
+                # A forced mate has been found, deeper searches can't improve on it
+                break
+            # Another iteration takes several times as long as this one, so don't start one that can't finish
+            if self.deadline is not None and time.perf_counter() - self.limit_start > (self.deadline - self.limit_start) / 2:
+                break
+        return best_move, best_score
+
+    def effective_branching_factor(self):
+        # Average growth in nodes from one completed iteration to the next
+        counts = self.iteration_nodes
+        if len(counts) < 2 or counts[0] == 0:
+            return 0.0
+        return (counts[-1] / counts[0]) ** (1 / (len(counts) - 1))
+
+    def stats(self):
+        return {
+            'depth': self.completed_depth,
+            'nodes': self.nodes,
+            'iteration_nodes': list(self.iteration_nodes),
+            'effective_branching_factor': self.effective_branching_factor(),
+            'first_move_cutoff_rate': self.first_move_cutoffs / self.cutoffs if self.cutoffs else 0.0,
+            'tt': self.tt.stats(),
+            'pawn_table': self.pawn_table.stats()
+        }
+
+def principal_variation(board, tt, max_length=MAX_DEPTH):
+    # Follow the best moves stored in the table from board, leaving it as it was
+    line = []
+    seen = set()
+    while len(line) < max_length and board.hash not in seen:
+        seen.add(board.hash)
+        entry = tt.probe(board.hash)
+        if entry is None or entry[3] not in board.legal_moves():
+            break
+        line.append(entry[3])
+        board.make_move(entry[3])
+    for move in line:
+        board.unmake_move()
+    return line
+
+def score_to_tt(score, ply):
+    # Mate scores are stored as distance from this node rather than from the root
+    if score > MATE_BOUND:
+        return score + ply
+    if score < -MATE_BOUND:
+        return score - ply
+    return score
+
+def score_from_tt(score, ply):
+    if score > MATE_BOUND:
+        return score - ply
+    if score < -MATE_BOUND:
+        return score + ply
+    return score
+
+def search_position(position, active_colour, castling, en_passant, halfmove=0, fullmove=1, depth=None, movetime=None, nodes=None, hash_mb=16):
+    # Search the tuple read_fen_position returns and give back (best_move, score).
+    # best_move is a packed move int, see move_name in bitboard.py.
+    if depth is None and movetime is None and nodes is None:
+        movetime = 1.0
+    board = Board.from_position(position, active_colour, castling, en_passant, halfmove, fullmove)
+    return Searcher(board, hash_mb=hash_mb).search(depth, movetime, nodes)
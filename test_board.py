@@ -0,0 +1,75 @@
+# Tests for the state Board keeps up to date incrementally, against the functions that work it out from scratch
+#
+#   python -m pytest test_board.py
+
+import random
+import unittest
+
+import nnue
+from bitboard import Board
+from evaluation import evaluate, evaluate_board
+from pawns import PawnHashTable
+from perft import REFERENCE_POSITIONS
+from zobrist import hash_board
+
+GAMES_PER_POSITION = 8
+MAX_PLIES = 60
+
+def playouts(seed):
+    # Yield (board, start fen) at every ply of random games from each reference position
+    rng = random.Random(seed)
+    for fen in REFERENCE_POSITIONS.values():
+        for game in range(GAMES_PER_POSITION):
+            board = Board.from_fen(fen)
+            yield board, fen
+            for ply in range(MAX_PLIES):
+                moves = board.legal_moves()
+                if not moves:
+                    break
+                board.make_move(rng.choice(moves))
+                yield board, fen
+
+class BoardTest(unittest.TestCase):
+    def test_make_unmake_round_trip(self):
+        rng = random.Random(1)
+        for board, fen in playouts(1):
+            before = (board.fen(), board.hash, board.pawn_hash, list(board.pieces), list(board.squares),
+                      board.middlegame, board.endgame, board.phase)
+            for move in rng.sample(board.legal_moves(), min(4, len(board.legal_moves()))):
+                board.make_move(move)
+                board.unmake_move()
+                after = (board.fen(), board.hash, board.pawn_hash, list(board.pieces), list(board.squares),
+                         board.middlegame, board.endgame, board.phase)
+                self.assertEqual(after, before)
+
+    def test_game_unwinds_to_start(self):
+        for board, fen in playouts(2):
+            if len(board.undo_stack) == MAX_PLIES or not board.legal_moves():
+                key = hash_board(Board.from_fen(fen))
+                while board.undo_stack:
+                    board.unmake_move()
+                self.assertEqual(board.fen(), fen)
+                self.assertEqual(board.hash, key)
+
+    def test_hash_matches_full_hash(self):
+        for board, fen in playouts(3):
+            self.assertEqual(board.hash, hash_board(board), board.fen())
+
+    def test_evaluation_matches_rescan(self):
+        pawn_table = PawnHashTable()
+        for board, fen in playouts(4):
+            score = evaluate_board(board)
+            self.assertEqual(evaluate(board), score, board.fen())
+            self.assertEqual(evaluate(board, pawn_table), score, board.fen())
+
+    @unittest.skipIf(nnue.np is None, "the neural evaluation needs NumPy")
+    def test_accumulator_matches_refresh(self):
+        network = nnue.Network.random(hidden=32, seed=1)
+        for board, fen in playouts(5):
+            if board.accumulator is None:
+                network.attach(board)
+            self.assertTrue((board.accumulator.values == network.refresh(board)).all(), board.fen())
+            self.assertEqual(network.evaluate(board), network.evaluate_from_scratch(board))
+
+if __name__ == '__main__':
+    unittest.main()
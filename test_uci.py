@@ -0,0 +1,87 @@
+# Tests for the UCI front end, driving UciEngine.handle the way a GUI would
+#
+#   python -m pytest test_uci.py
+
+import io
+import time
+import unittest
+
+from bitboard import Board, move_name
+from uci import UciEngine, time_for_move, MOVE_OVERHEAD
+
+KIWIPETE = 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1'
+# Seconds by which a search that heeds its limits has answered, even on a slow or loaded machine.
+# An unlimited search of Kiwipete runs far longer; the exact budgets are checked through the searcher.
+ANSWER_WITHIN = 1.0
+
+class UciEngineTest(unittest.TestCase):
+    def setUp(self):
+        self.output = io.StringIO()
+        self.engine = UciEngine(output_stream=self.output)
+
+    def tearDown(self):
+        self.engine.stop_search()
+
+    def lines(self):
+        with self.engine.output_lock:
+            return self.output.getvalue().splitlines()
+
+    def wait_for_bestmove(self, timeout=5.0):
+        # The bestmove line and the seconds it took to arrive
+        start = time.perf_counter()
+        while time.perf_counter() - start < timeout:
+            for line in self.lines():
+                if line.startswith('bestmove'):
+                    return line, time.perf_counter() - start
+            time.sleep(0.001)
+        self.fail('no bestmove')
+
+    def assert_legal(self, line, fen):
+        legal = [move_name(move) for move in Board.from_fen(fen).legal_moves()]
+        self.assertIn(line.split()[1], legal)
+
+    def assert_time_limit(self, movetime):
+        searcher = self.engine.searcher
+        self.assertAlmostEqual(searcher.deadline - searcher.limit_start, movetime)
+
+    def test_short_clock(self):
+        # Without movestogo the search gets a thirtieth of what is left on the clock
+        self.engine.handle(f'position fen {KIWIPETE}')
+        self.engine.handle('go wtime 1000 btime 1000')
+        line, elapsed = self.wait_for_bestmove()
+        self.assert_time_limit(time_for_move(1000))
+        self.assertLess(elapsed, ANSWER_WITHIN)
+        self.assert_legal(line, KIWIPETE)
+
+    def test_movetime(self):
+        self.engine.handle(f'position fen {KIWIPETE}')
+        self.engine.handle('go movetime 200')
+        line, elapsed = self.wait_for_bestmove()
+        self.assert_time_limit(0.2 - MOVE_OVERHEAD)
+        self.assertLess(elapsed, ANSWER_WITHIN)
+        self.assert_legal(line, KIWIPETE)
+
+    def test_stop_during_first_iteration(self):
+        self.engine.handle(f'position fen {KIWIPETE}')
+        self.engine.handle('go infinite')
+        time.sleep(0.02)
+        start = time.perf_counter()
+        self.engine.handle('stop')
+        # stop waits for the search thread, so the bestmove is already out
+        self.assertLess(time.perf_counter() - start, ANSWER_WITHIN)
+        self.assertIsNone(self.engine.thread)
+        line = [line for line in self.lines() if line.startswith('bestmove')][0]
+        self.assert_legal(line, KIWIPETE)
+
+    def test_ponder_holds_bestmove_until_ponderhit(self):
+        fen = '6k1/5ppp/8/8/8/8/8/1R4K1 w - - 0 1'
+        self.engine.handle(f'position fen {fen}')
+        self.engine.handle('go ponder depth 3')
+        time.sleep(0.2)
+        self.assertFalse(any(line.startswith('bestmove') for line in self.lines()))
+        self.engine.handle('ponderhit')
+        line, elapsed = self.wait_for_bestmove()
+        self.assertEqual(line, 'bestmove b1b8')
+
+if __name__ == '__main__':
+    unittest.main()
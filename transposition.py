@@ -0,0 +1,128 @@
+# Fixed-size transposition table keyed by the 64-bit Zobrist hash
+#
+# Entries live in one flat array of unsigned 64-bit ints, two per entry: the
+# full key, then the entry data packed into a single int:
+#
+#   bits  0-15  best move (the packed move ints from bitboard.py)
+#   bits 16-31  score + 32768
+#   bits 32-39  depth
+#   bits 40-41  bound type
+#   bits 42-47  age of the search that stored it
+#
+# so memory use is exactly 16 bytes an entry, with no Python object per entry.
+#
+# The first word is stored as key XOR data rather than the key itself. The
+# table can live in shared memory with several processes writing it at once
+# (see parallel.py), and an entry half written by one while another reads it
+# then fails the key check instead of being trusted, without any locking.
+
+from array import array
+
+# Bound types: the stored score is exact, a lower bound (fail high) or an upper bound (fail low)
+EXACT = 1
+LOWER = 2
+UPPER = 3
+
+ENTRY_BYTES = 16
+AGE_MASK = 63
+
+def table_bytes(size_mb):
+    # Bytes used by a table of size_mb, a power of two number of entries
+    entries = max(1, int(size_mb * 1024 * 1024) // ENTRY_BYTES)
+    return (1 << (entries.bit_length() - 1)) * ENTRY_BYTES
+
+class TranspositionTable:
+    def __init__(self, size_mb=16, buffer=None):
+        self.resize(size_mb, buffer)
+
+    def resize(self, size_mb, buffer=None):
+        # Use the largest power of two number of entries that fits, so the index is a mask.
+        # buffer is writable memory of at least table_bytes(size_mb) to keep the entries in,
+        # e.g. a multiprocessing.shared_memory block; otherwise the table has its own array.
+        self.size = table_bytes(size_mb) // ENTRY_BYTES
+        self.mask = self.size - 1
+        self.buffer = buffer
+        if buffer is None:
+            self.table = array('Q', bytes(self.size * ENTRY_BYTES))
+        else:
+            self.table = memoryview(buffer)[:self.size * ENTRY_BYTES].cast('Q')
+        self.age = 0
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0
+        self.stores = 0
+        self.replacements = 0
+
+    def clear(self):
+        if self.buffer is None:
+            self.table = array('Q', bytes(self.size * ENTRY_BYTES))
+        else:
+            self.table.cast('B')[:] = bytes(self.size * ENTRY_BYTES)
+        self.age = 0
+
+    def new_search(self):
+        # Entries from earlier searches become the first to be replaced
+        self.age = (self.age + 1) & AGE_MASK
+
+    def probe(self, key):
+        # Returns (depth, score, bound, move) for key, or None
+        index = (key & self.mask) << 1
+        table = self.table
+        data = table[index + 1]
+        if data:
+            if table[index] ^ data == key:
+                self.hits += 1
+                return (data >> 32) & 0xFF, ((data >> 16) & 0xFFFF) - 32768, (data >> 40) & 3, data & 0xFFFF
+            # The slot holds a different position that shares the index, or a torn write
+            self.collisions += 1
+        self.misses += 1
+        return None
+
+    def store(self, key, depth, score, bound, move=0):
+        index = (key & self.mask) << 1
+        table = self.table
+        data = table[index + 1]
+        if data and table[index] ^ data != key:
+            # Keep deeper results from the current search, replace anything older
+            if (data >> 42) & AGE_MASK == self.age and (data >> 32) & 0xFF > depth:
+                return
+            self.replacements += 1
+        elif data:
+            # The same position: keep a deeper result from the current search unless this one is exact,
+            # as a process sharing the table may still be searching it at a shallower depth
+            if bound != EXACT and (data >> 42) & AGE_MASK == self.age and (data >> 32) & 0xFF > depth:
+                return
+            if not move:
+                # Don't lose the best move of a shallower search of the same position
+                move = data & 0xFFFF
+        score = max(-32767, min(32767, score))
+        data = (move & 0xFFFF) | ((score + 32768) << 16) | (max(0, min(depth, 255)) << 32) | (bound << 40) | (self.age << 42)
+        table[index] = key ^ data
+        table[index + 1] = data
+        self.stores += 1
+
+    def hashfull(self):
+        # Permille of a sample of entries written by the current search, as reported over UCI
+        sample = min(self.size, 1000)
+        used = 0
+        for index in range(sample):
+            data = self.table[(index << 1) + 1]
+            if data and (data >> 42) & AGE_MASK == self.age:
+                used += 1
+        return used * 1000 // sample
+
+    def stats(self):
+        probes = self.hits + self.misses
+        return {
+            'entries': self.size,
+            'probes': probes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'collisions': self.collisions,
+            'stores': self.stores,
+            'replacements': self.replacements,
+            'hit_rate': self.hits / probes if probes else 0.0
+        }
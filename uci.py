@@ -0,0 +1,321 @@
+# UCI (Universal Chess Interface) front end, for running the engine without the pygame window
+#
+# Chess GUIs and tournament managers start the engine as a process and talk
+# to it in lines of text over stdin and stdout:
+#
+#   python uci.py
+#   python -m chess --uci
+#
+# The main thread reads commands as they arrive and each 'go' searches in a
+# thread of its own, so 'stop', 'isready' and 'ponderhit' are dealt with
+# while the engine is thinking. Understood:
+#
+#   uci, isready, ucinewgame, quit
+#   setoption name Hash value <mb>
+#   setoption name Threads value <n>
+#   position (startpos | fen <fen>) [moves <move> ...]
+#   go [ponder] [infinite] [depth <n>] [nodes <n>] [movetime <ms>]
+#      [wtime <ms>] [btime <ms>] [winc <ms>] [binc <ms>] [movestogo <n>]
+#   stop, ponderhit
+#
+# As in engine.py, a ponder search ignores the clock until ponderhit starts
+# it, and neither a ponder nor an infinite search sends its bestmove before
+# the GUI has said ponderhit or stop, even if it finishes early. Anything else
+# is ignored, as the protocol asks.
+#
+# With Threads above 1 the search is a ParallelSearch (see parallel.py) over
+# that many processes, with a shared table of its own of the Hash size.
+
+import sys
+import threading
+import time
+
+from bitboard import Board, move_name
+from parallel import ParallelSearch
+from search import Searcher, MATE_SCORE, MATE_BOUND, principal_variation
+from transposition import TranspositionTable
+
+ENGINE_NAME = 'Chess'
+ENGINE_AUTHOR = 'bencheshire18'
+START_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+
+DEFAULT_HASH_MB = 16
+MAX_HASH_MB = 1024
+MAX_THREADS = 64
+# Moves the remaining clock time is shared out over when the GUI doesn't send movestogo
+MOVES_TO_GO = 30
+# Seconds kept back from every move for the GUI and the pipes between us
+MOVE_OVERHEAD = 0.05
+
+GO_VALUES = ('depth', 'nodes', 'movetime', 'wtime', 'btime', 'winc', 'binc', 'movestogo')
+
+def time_for_move(remaining, increment=0, moves_to_go=None):
+    # Seconds to spend on a move given the clock in milliseconds, as the GUI sends it
+    moves = moves_to_go or MOVES_TO_GO
+    movetime = (remaining / moves + increment / 2) / 1000
+    return max(0.0, min(movetime, remaining / 1000 - MOVE_OVERHEAD))
+
+def score_string(score):
+    # UCI scores are in centipawns, or in moves (not plies) to mate, negative when getting mated
+    if score > MATE_BOUND:
+        return f'mate {(MATE_SCORE - score + 1) // 2}'
+    if score < -MATE_BOUND:
+        return f'mate -{(MATE_SCORE + score) // 2}'
+    return f'cp {score}'
+
+def read_fen(fen):
+    # A Board for fen, or None if it isn't a position the search can be given
+    placement = fen.split()[0] if fen.split() else ''
+    squares = sum(int(char) if char.isdigit() else 1 for char in placement.replace('/', ''))
+    if squares != 64 or placement.count('K') != 1 or placement.count('k') != 1:
+        return None
+    try:
+        return Board.from_fen(fen)
+    except (ValueError, IndexError, KeyError):
+        return None
+
+def parse_go(tokens):
+    # The limits after 'go' as a dict, with 'ponder' and 'infinite' as flags
+    limits = {'ponder': False, 'infinite': False}
+    index = 0
+    while index < len(tokens):
+        token = tokens[index]
+        if token in ('ponder', 'infinite'):
+            limits[token] = True
+        elif token in GO_VALUES and index + 1 < len(tokens):
+            try:
+                limits[token] = int(tokens[index + 1])
+            except ValueError:
+                pass
+            index += 1
+        index += 1
+    return limits
+
+class UciEngine:
+    def __init__(self, input_stream=None, output_stream=None):
+        self.input_stream = input_stream if input_stream is not None else sys.stdin
+        self.output_stream = output_stream if output_stream is not None else sys.stdout
+        self.output_lock = threading.Lock()
+        self.hash_mb = DEFAULT_HASH_MB
+        self.tt = TranspositionTable(DEFAULT_HASH_MB)
+        self.threads = 1
+        # The search when Threads is above 1, made again whenever Hash or Threads change
+        self.parallel = None
+        self.board = Board.from_fen(START_FEN)
+        self.searcher = None
+        self.thread = None
+        # Guards the pondering state between the reading and the searching thread
+        self.search_lock = threading.Lock()
+        # Set while the current search mustn't send bestmove yet: it is pondering or infinite
+        self.waiting = False
+        # movetime to give the ponder search on ponderhit
+        self.ponder_movetime = None
+        # A finished search's bestmove line, kept back until ponderhit or stop
+        self.held = None
+
+    def send(self, line):
+        with self.output_lock:
+            self.output_stream.write(line + '\n')
+            self.output_stream.flush()
+
+    def run(self):
+        # Read and act on commands until 'quit' or the end of the input
+        for line in self.input_stream:
+            if not self.handle(line):
+                break
+        self.stop_search()
+        self.close_parallel()
+
+    def handle(self, line):
+        # Returns False once it's time to quit
+        tokens = line.split()
+        if not tokens:
+            return True
+        command = tokens[0]
+        if command == 'uci':
+            self.send(f'id name {ENGINE_NAME}')
+            self.send(f'id author {ENGINE_AUTHOR}')
+            self.send(f'option name Hash type spin default {DEFAULT_HASH_MB} min 1 max {MAX_HASH_MB}')
+            self.send(f'option name Threads type spin default 1 min 1 max {MAX_THREADS}')
+            self.send('option name Ponder type check default false')
+            self.send('uciok')
+        elif command == 'isready':
+            self.send('readyok')
+        elif command == 'ucinewgame':
+            self.stop_search()
+            self.tt.clear()
+            if self.parallel is not None:
+                self.parallel.tt.clear()
+        elif command == 'setoption':
+            self.stop_search()
+            self.set_option(tokens[1:])
+        elif command == 'position':
+            self.stop_search()
+            self.set_position(tokens[1:])
+        elif command == 'go':
+            self.stop_search()
+            self.go(parse_go(tokens[1:]))
+        elif command == 'stop':
+            self.stop_search()
+        elif command == 'ponderhit':
+            self.ponderhit()
+        elif command == 'quit':
+            return False
+        return True
+
+    def set_option(self, tokens):
+        # setoption name <name> value <value>, where the name can have spaces in it
+        if 'name' not in tokens:
+            return
+        name_start = tokens.index('name') + 1
+        value_start = tokens.index('value') if 'value' in tokens else len(tokens)
+        name = ' '.join(tokens[name_start:value_start]).lower()
+        value = ' '.join(tokens[value_start + 1:])
+        if name not in ('hash', 'threads'):
+            return
+        try:
+            number = int(value)
+        except ValueError:
+            return
+        if name == 'hash':
+            self.hash_mb = max(1, min(number, MAX_HASH_MB))
+            self.tt.resize(self.hash_mb)
+        else:
+            self.threads = max(1, min(number, MAX_THREADS))
+        self.close_parallel()
+        if self.threads > 1:
+            # Made now so starting its processes doesn't come out of the first search's time
+            self.parallel = ParallelSearch(self.threads, self.hash_mb)
+
+    def close_parallel(self):
+        if self.parallel is not None:
+            self.parallel.close()
+            self.parallel = None
+
+    def set_position(self, tokens):
+        # position startpos [moves ...] or position fen <fen> [moves ...]
+        moves_start = tokens.index('moves') if 'moves' in tokens else len(tokens)
+        if tokens and tokens[0] == 'fen':
+            fen = ' '.join(tokens[1:moves_start])
+        else:
+            fen = START_FEN
+        board = read_fen(fen)
+        if board is None:
+            self.send(f'info string invalid fen {fen}')
+            return
+        for name in tokens[moves_start + 1:]:
+            moves = {move_name(move): move for move in board.legal_moves()}
+            if name not in moves:
+                self.send(f'info string illegal move {name}')
+                break
+            board.make_move(moves[name])
+        self.board = board
+
+    def go(self, limits):
+        board = self.board
+        movetime = None
+        if 'movetime' in limits:
+            movetime = max(0.0, limits['movetime'] / 1000 - MOVE_OVERHEAD)
+        else:
+            clock, increment = ('wtime', 'winc') if board.colour == 0 else ('btime', 'binc')
+            if clock in limits:
+                movetime = time_for_move(limits[clock], limits.get(increment, 0), limits.get('movestogo'))
+        depth = limits.get('depth')
+        nodes = limits.get('nodes')
+        if limits['infinite']:
+            depth = nodes = movetime = None
+
+        with self.search_lock:
+            self.waiting = limits['ponder'] or limits['infinite']
+            self.ponder_movetime = movetime if limits['ponder'] else None
+            self.held = None
+        if limits['ponder']:
+            # The clock only starts on ponderhit
+            movetime = None
+        if self.threads > 1:
+            # A stop sent to the last search can have come after it ended
+            self.parallel.reset_limits()
+            self.searcher = self.parallel
+            self.thread = threading.Thread(target=self.search_parallel, args=(self.parallel, board, depth, movetime, nodes), daemon=True)
+        else:
+            self.searcher = Searcher(board, tt=self.tt)
+            self.thread = threading.Thread(target=self.search, args=(self.searcher, depth, movetime, nodes), daemon=True)
+        self.thread.start()
+
+    def search(self, searcher, depth, movetime, nodes):
+        # Runs in the search thread
+        def report(current, score, best_move, searcher):
+            elapsed = time.perf_counter() - searcher.start_time
+            nps = int(searcher.nodes / elapsed) if elapsed > 0 else 0
+            pv = ' '.join(move_name(move) for move in searcher.principal_variation())
+            self.send(f'info depth {current} score {score_string(score)} nodes {searcher.nodes} nps {nps} '
+                      f'time {int(elapsed * 1000)} hashfull {searcher.tt.hashfull()} pv {pv}')
+
+        best_move, score = searcher.search(depth, movetime, nodes, on_iteration=report)
+        self.send_bestmove(best_move, searcher.principal_variation(2))
+
+    def search_parallel(self, parallel, board, depth, movetime, nodes):
+        # Runs in the search thread when Threads is above 1. Workers store over each
+        # other's entries, so the table's line may not start with the move reported.
+        start_time = time.perf_counter()
+
+        def report(current, score, best_move):
+            elapsed = time.perf_counter() - start_time
+            nps = int(parallel.nodes / elapsed) if elapsed > 0 else 0
+            pv = principal_variation(board, parallel.tt)
+            if not pv or pv[0] != best_move:
+                pv = [best_move]
+            pv = ' '.join(move_name(move) for move in pv)
+            self.send(f'info depth {current} score {score_string(score)} nodes {parallel.nodes} nps {nps} '
+                      f'time {int(elapsed * 1000)} hashfull {parallel.tt.hashfull()} pv {pv}')
+
+        best_move, score = parallel.search(board, depth, movetime, nodes, on_iteration=report)
+        self.send_bestmove(best_move, principal_variation(board, parallel.tt, 2))
+
+    def send_bestmove(self, best_move, pv):
+        # Send bestmove with the reply to ponder on if pv has one, or hold it back if the GUI hasn't asked for it yet
+        if best_move:
+            line = f'bestmove {move_name(best_move)}'
+            if len(pv) == 2 and pv[0] == best_move:
+                line += f' ponder {move_name(pv[1])}'
+        else:
+            # Checkmated or stalemated already: the protocol's null move
+            line = 'bestmove 0000'
+        with self.search_lock:
+            if self.waiting:
+                self.held = line
+                return
+        self.send(line)
+
+    def ponderhit(self):
+        # The move pondered on was played: the search carries on against the clock
+        with self.search_lock:
+            if not self.waiting or self.searcher is None:
+                return
+            self.waiting = False
+            if self.ponder_movetime is not None:
+                self.searcher.set_time_limit(self.ponder_movetime)
+            line = self.held
+            self.held = None
+        if line is not None:
+            self.send(line)
+
+    def stop_search(self):
+        # Stop the search if one is running and wait for it to send its bestmove
+        with self.search_lock:
+            self.waiting = False
+            line = self.held
+            self.held = None
+        if line is not None:
+            self.send(line)
+        if self.thread is None:
+            return
+        self.searcher.stop()
+        self.thread.join()
+        self.thread = None
+
+def main():
+    UciEngine().run()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+# Zobrist keys: a 64-bit hash of a position built by XORing one random key per feature
+#
+# The features are each piece on each square, black to move, each castling
+# right and the file of the en passant square. Because XOR undoes itself, a
+# move only has to XOR out what it removes and XOR in what it adds, which is
+# what Board.make_move in bitboard.py does. hash_position here computes the
+# same key from scratch for checking.
+
+import random
+
+# A fixed seed keeps hashes the same from run to run, so they can be stored and compared
+key_source = random.Random(0x5A0B1157)
+
+def random_key():
+    return key_source.getrandbits(64)
+
+PIECE_KEYS = {piece: tuple(random_key() for square in range(64)) for piece in 'PNBRQKpnbrqk'}
+BLACK_TO_MOVE_KEY = random_key()
+# One key per castling right, in the same bit order as bitboard.py: K=1, Q=2, k=4, q=8
+CASTLING_RIGHT_KEYS = {right: random_key() for right in 'KQkq'}
+EN_PASSANT_KEYS = tuple(random_key() for file in range(8))
+
+def build_castling_keys():
+    # Pre-combined keys for all 16 sets of castling rights, indexed by the bit flags
+    keys = []
+    for flags in range(16):
+        key = 0
+        for bit, right in enumerate('KQkq'):
+            if flags >> bit & 1:
+                key ^= CASTLING_RIGHT_KEYS[right]
+        keys.append(key)
+    return tuple(keys)
+
+CASTLING_KEYS = build_castling_keys()
+
+def hash_position(position, active_colour, castling, en_passant, halfmove=None, fullmove=None):
+    # Full hash of the tuple read_fen_position returns, e.g. hash_position(*read_fen_position(name))
+    key = 0
+    for square, piece in enumerate(position):
+        if piece is not None:
+            key ^= PIECE_KEYS[piece][square]
+    if active_colour == 'b':
+        key ^= BLACK_TO_MOVE_KEY
+    for right in castling:
+        if right in CASTLING_RIGHT_KEYS:
+            key ^= CASTLING_RIGHT_KEYS[right]
+    if en_passant != '-':
+        key ^= EN_PASSANT_KEYS['abcdefgh'.index(en_passant[0])]
+    return key
+
+def hash_board(board):
+    # Full hash of a bitboard.Board, to check the incrementally updated board.hash against
+    return hash_position(*board.to_position())